@@ -1,64 +1,163 @@
 from datetime import datetime
-from datetime import timedelta
+import json
 import os
-import stat
+import sqlite3
+import threading
 import time
+from types import MappingProxyType
 
 from flask import Flask
 from flask import render_template
 
 from cron_converter import Cron
-from cron_descriptor import get_description, ExpressionDescriptor
+from cron_descriptor import get_description
 
 import config
 from datedifference import humanize_date_difference
+from history import RunHistory, summary
+
+# Seconds the status of the scrapers is reused before the files are checked again.
+STATUS_TTL = 10
 
 # Create Flask's `app` object
 app = Flask(__name__)
 app.config.from_object('config')
 
+# The parsed crontab and the modification time of the file it was parsed from.
+_cron_cache = (None, ())
+# The status of the scrapers and when it was computed.
+_status_cache = (None, ())
+_lock = threading.Lock()
+_history = None
+# The rendered page and the status it shows. Like the status, it is only used with the lock.
+_page_cache = (None, None)
 
-@app.route('/')
-def home():
-    """Landing page."""
 
-    now = datetime.now()
+def read_cron(path):
+    """
+    Parse the crontab. The result is reused until the file changes.
+    :return: Tuple of (line, Cron, description) for every job.
+    """
+    global _cron_cache
+    mtime = os.stat(path).st_mtime_ns
+    if _cron_cache[0] == mtime:
+        return _cron_cache[1]
+
+    entries = []
+    with open(path, "r") as cronfile:
+        for line in cronfile.readlines():
+            if not line.strip() or line[0] == "#":
+                continue
+            cron_schedule_str = " ".join(line.split()[:5])
+            cron_instance = Cron()
+            cron_instance.from_string(cron_schedule_str)
+            entries.append((line, cron_instance, get_description(cron_schedule_str)))
+    _cron_cache = (mtime, tuple(entries))
+    return _cron_cache[1]
+
+
+def read_daemon_state(path):
+    """The state of the jobs, by script, if the scrapers are run by the scraper daemon."""
+    try:
+        with open(path, "r") as statefile:
+            return json.load(statefile)['jobs']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def read_history(now):
+    """
+    Add the new runs of the scrapers to the history.
+    :return: The history, or None if it cannot be used.
+    """
+    global _history
+    try:
+        if _history is None:
+            _history = RunHistory(app.config['HISTORY_DATABASE'], app.config['HISTORY_RETENTION'])
+        _history.ingest(app.config['RUNS_FILE'], now.timestamp())
+    except (OSError, sqlite3.Error):
+        app.logger.exception("Could not update the history of the runs")
+        return None
+    return _history
+
+
+def pretty_time(now, moment):
+    """How long ago a moment was, for humans. humanize_date_difference fails on a difference of less than a second."""
+    if (now - moment).total_seconds() < 1:
+        return "just now"
+    return humanize_date_difference(now=now, otherdate=moment)
+
+
+def read_heartbeat(scraper_name):
+    """The end of the last successful run of a scraper, or None if it has not succeeded yet."""
+    try:
+        return datetime.fromtimestamp(os.stat(app.config['HEARTBEAT_FILE'].format(scraper=scraper_name)).st_mtime)
+    except OSError:
+        return None
+
+
+def compute_status(now):
+    """
+    Check the output of every scraper against its schedule.
+    :return: Tuple with a read-only dictionary for every scraper.
+    """
+    daemon_jobs = read_daemon_state(app.config['DAEMON_STATE_FILE'])
+    history = read_history(now)
     scrape_status_results = []
     for scrape_check in app.config['LAST_SCRAPED_FILE']:
         file_stats = os.stat(f"{app.config['PUBLIC_DIR']}/{scrape_check['last_modified_file_path']}")
 
-        last_modification_time = datetime.fromtimestamp(file_stats[stat.ST_MTIME])
-        data = scrape_check
+        last_modification_time = datetime.fromtimestamp(file_stats.st_mtime)
+        data = dict(scrape_check)
         data['last_modification_time'] = last_modification_time
-        data['last_modification_time_pretty'] = humanize_date_difference(now=now, otherdate=last_modification_time)
+        data['last_modification_time_pretty'] = pretty_time(now, last_modification_time)
+        data['daemon'] = daemon_jobs.get(scrape_check['cron_scriptname'])
+        # The runs are recorded by the name of the script, e.g. news for news.py.
+        scraper_name = os.path.splitext(scrape_check['cron_scriptname'])[0]
+        # Output that did not change is not written again, so its modification time is not that of the last run.
+        last_success = read_heartbeat(scraper_name)
+        data['last_success'] = last_success
+        data['last_success_pretty'] = pretty_time(now, last_success) if last_success is not None else None
+        data['history'] = summary(history, scraper_name, now.timestamp()) if history is not None else None
+        data['last_run_failed'] = data['history'] is not None and data['history']['last']['status'] != 'ok'
         scrape_status_results.append(data)
 
-    with open(f"{app.config['SCRAPER_DIR']}/hydra.cron", "r") as cronfile:
-        for line in cronfile.readlines():
-            if line[0] == "#":
-                continue
-            cron_schedule_str = " ".join(line.split(" ")[:5])
-            cron_instance = Cron()
-            cron_instance.from_string(cron_schedule_str)
-            cron_pretty = ExpressionDescriptor(cron_schedule_str)
-
-            # Raw datetime without timezone info (not aware)
-            reference = datetime.now()
-            # Get the iterator, initialised to now
-            schedule = cron_instance.schedule(reference)
-           
-            for scraper in scrape_status_results:
-                if scraper["cron_scriptname"] in line:
-                    scraper["cron_instance"] = cron_instance
-                    scraper["cron_pretty"] = cron_pretty
-                    scraper["last_scrape_failed"] = schedule.prev() > scraper["last_modification_time"]
-                    break
-
-
-    return render_template(
-        'index.html',
-        scrape_status_results=scrape_status_results,
-    )
+    for line, cron_instance, cron_pretty in read_cron(f"{app.config['SCRAPER_DIR']}/hydra.cron"):
+        for scraper in scrape_status_results:
+            if scraper["cron_scriptname"] in line:
+                # Get the iterator, initialised to now (raw datetime without timezone info)
+                schedule = cron_instance.schedule(now)
+                scraper["cron_pretty"] = cron_pretty
+                last_success = scraper["last_success"]
+                scraper["last_scrape_failed"] = last_success is None or schedule.prev() > last_success
+                break
+
+    return tuple(MappingProxyType(scraper) for scraper in scrape_status_results)
+
+
+def current_status():
+    """The status of the scrapers, computed at most once every STATUS_TTL seconds. It must not be changed."""
+    global _status_cache
+    with _lock:
+        computed, status = _status_cache
+        if computed is None or time.monotonic() - computed > STATUS_TTL:
+            status = compute_status(datetime.now())
+            _status_cache = (time.monotonic(), status)
+        return status
+
+
+@app.route('/')
+def home():
+    """Landing page. It is rendered again when the status changes."""
+    global _page_cache
+    status = current_status()
+    with _lock:
+        if _page_cache[0] is not status:
+            _page_cache = (status, render_template(
+                'index.html',
+                scrape_status_results=status,
+            ))
+        return _page_cache[1]
 
 
 if __name__ == "__main__":
@@ -2,11 +2,25 @@ import os
 
 PUBLIC_DIR = os.environ.get("PUBLIC_DIR")
 SCRAPER_DIR = os.environ.get("SCRAPER_DIR")
+# The metrics folder of the scrapers (HYDRA_METRICS_DIR, see metrics.py).
+METRICS_DIR = os.environ.get("METRICS_DIR")
 
 if not PUBLIC_DIR:
     raise ValueError("No PUBLIC_DIR set for Flask application")
 if not SCRAPER_DIR:
     raise ValueError("No SCRAPER_DIR set for Flask application")
+if not METRICS_DIR:
+    raise ValueError("No METRICS_DIR set for Flask application")
+
+# Written by the scraper daemon (daemon.py), if it is used instead of cron.
+DAEMON_STATE_FILE = os.path.join(SCRAPER_DIR, 'daemon-state.json')
+
+# The scrapers append a record of every run here (see metrics.py). The runs are kept in the database for the trends.
+RUNS_FILE = os.path.join(METRICS_DIR, 'runs.jsonl')
+HISTORY_DATABASE = os.path.join(METRICS_DIR, 'history.sqlite3')
+# Touched by every successful run of a scraper, by the name of its script (see metrics.py).
+HEARTBEAT_FILE = os.path.join(METRICS_DIR, '{scraper}.heartbeat')
+HISTORY_RETENTION = 400 * 24 * 60 * 60  # Seconds a run is kept in the history
 
 LAST_SCRAPED_FILE = [{
     'name': 'Resto scraper',
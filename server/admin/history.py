@@ -0,0 +1,179 @@
+"""
+History of the runs of the scrapers, kept in a SQLite database.
+
+The scrapers append a record for every run to a JSON lines file (see scraper/metrics.py). The new lines of that file
+are copied into the database, where they are kept for a while, so the admin page can show trends without reading the
+whole file. All queries select the runs of one scraper in a time range, which is covered by an index.
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import statistics
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    scraper TEXT NOT NULL,
+    start REAL NOT NULL,
+    duration REAL NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    requests INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    items INTEGER NOT NULL,
+    written INTEGER NOT NULL,
+    unchanged INTEGER NOT NULL,
+    -- The scraper and start identify a run, so runs that are read twice are only stored once. This is also the index
+    -- of all queries by scraper.
+    PRIMARY KEY (scraper, start)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS runs_by_start ON runs (start);
+-- How far the file with the records was read.
+CREATE TABLE IF NOT EXISTS ingested (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+"""
+
+COLUMNS = ('scraper', 'start', 'duration', 'status', 'error', 'requests', 'bytes', 'items', 'written', 'unchanged')
+
+
+def _row(record):
+    """The values of the columns for a record, or None if it is not a valid record."""
+    try:
+        files = record.get('files', {})
+        return (str(record['scraper']), float(record['start']), float(record['duration']), str(record['status']),
+                record.get('error'), int(record.get('requests', 0)), int(record.get('bytes', 0)),
+                int(record.get('items', 0)), int(files.get('written', 0)), int(files.get('unchanged', 0)))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class RunHistory:
+    """
+    The runs of the scrapers in a SQLite database. The database can be used by multiple processes, e.g. the workers of
+    gunicorn.
+    :param path: The database file. It is created if needed.
+    :param retention: Seconds a run is kept.
+    """
+
+    def __init__(self, path, retention):
+        self.path = path
+        self.retention = retention
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        # A connection does not close at the end of a with block by itself, it only ends a transaction there.
+        return contextlib.closing(connection)
+
+    def ingest(self, runs_file, now=None):
+        """
+        Copy the new records of the runs file into the database, and remove the runs that are older than the retention.
+        If the file was replaced or truncated, it is read from the start again.
+        :return: The amount of new runs.
+        """
+        now = time.time() if now is None else now
+        try:
+            stat = os.stat(runs_file)
+        except FileNotFoundError:
+            stat = None
+
+        with self._connect() as connection:
+            # Only one process reads the file at a time.
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                added = 0
+                if stat is not None:
+                    added = self._ingest(connection, runs_file, stat)
+                connection.execute('DELETE FROM runs WHERE start < ?', (now - self.retention,))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        return added
+
+    def _ingest(self, connection, runs_file, stat):
+        path = os.path.abspath(runs_file)
+        state = connection.execute('SELECT inode, offset FROM ingested WHERE path = ?', (path,)).fetchone()
+        offset = 0
+        if state is not None and state['inode'] == stat.st_ino and state['offset'] <= stat.st_size:
+            offset = state['offset']
+        if offset == stat.st_size:
+            return 0
+
+        with open(runs_file, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        # A line that is still being written is read the next time.
+        complete = data[:data.rfind(b'\n') + 1]
+        rows = []
+        for line in complete.splitlines():
+            try:
+                row = _row(json.loads(line))
+            except ValueError:
+                row = None
+            if row is not None:
+                rows.append(row)
+
+        before = connection.total_changes
+        connection.executemany(
+            f"INSERT OR IGNORE INTO runs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+        added = connection.total_changes - before
+        connection.execute('INSERT OR REPLACE INTO ingested (path, inode, offset) VALUES (?, ?, ?)',
+                           (path, stat.st_ino, offset + len(complete)))
+        return added
+
+    def recent(self, scraper, limit):
+        """The last runs of a scraper, the most recent first."""
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute(
+                'SELECT * FROM runs WHERE scraper = ? ORDER BY start DESC LIMIT ?', (scraper, limit))]
+
+    def daily(self, scraper, since):
+        """Per day since a time: the amount of runs, the failed runs and the average and longest duration."""
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute(
+                "SELECT date(start, 'unixepoch', 'localtime') AS day, count(*) AS runs, "
+                "sum(status != 'ok') AS failed, avg(duration) AS average, max(duration) AS longest "
+                "FROM runs WHERE scraper = ? AND start >= ? GROUP BY day ORDER BY day DESC", (scraper, since))]
+
+
+def summary(history, scraper, now, runs=50, days=14, slow_factor=2.0, minimum=5):
+    """
+    The trends of a scraper for the admin page.
+    :param runs: The amount of recent runs to show. The median duration is that of the successful runs among them.
+    :param days: The amount of days to show the daily trend of.
+    :param slow_factor: A run is slow if it took this many times longer than the median.
+    :param minimum: The amount of successful runs needed before runs are flagged as slow.
+    :return: Dictionary with the recent runs (oldest first, with a flag if they were slow), the median duration, the
+             slow runs and the daily trend, or None if the scraper has no runs.
+    """
+    recent = history.recent(scraper, runs)
+    if not recent:
+        return None
+    durations = [run['duration'] for run in recent if run['status'] == 'ok']
+    median = statistics.median(durations) if durations else None
+    for run in recent:
+        run['slow'] = median is not None and len(durations) >= minimum and run['duration'] > slow_factor * median
+    longest = max(run['duration'] for run in recent) or 1
+    for run in recent:
+        run['started'] = datetime.fromtimestamp(run['start']).strftime('%Y-%m-%d %H:%M')
+        # Relative to the longest run, to draw the durations as bars.
+        run['height'] = run['duration'] / longest
+    return {
+        'last': recent[0],
+        'runs': tuple(reversed(recent)),
+        'median': median,
+        'slow': tuple(run for run in recent if run['slow']),
+        'failed': sum(run['status'] != 'ok' for run in recent),
+        'daily': tuple(history.daily(scraper, now - days * 24 * 60 * 60)),
+    }
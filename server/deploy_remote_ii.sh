@@ -31,6 +31,9 @@ public="$deployment/$1/public"
 historic="$deployment/$1/restodata"
 # Where the public api data will be kept
 api="$public/api"
+# Where the scrapers keep their metrics, outside the deployment, so they are kept between deployments.
+# This is the default of metrics.py.
+metrics="${HYDRA_METRICS_DIR:-${XDG_STATE_HOME:-$HOME/.local/state}/hydra/metrics}"
 # Where the website goes
 #website="$public/website"
 
@@ -96,7 +99,8 @@ crontab "$cron"
 
 # (Re-)Start the admin docker
 cd "$current_admin"
-podman-compose up --force-recreate --build -d
+mkdir -p "$metrics"
+HYDRA_METRICS_DIR="$metrics" podman-compose up --force-recreate --build -d
 cd -
 
 echo "Deployment complete."
@@ -0,0 +1,132 @@
+"""
+The HTTP adapters of the shared session in backoff.py.
+
+These are kept apart from backoff.py, since importing requests takes a while: this module is only imported when the
+session is created.
+"""
+
+from datetime import timedelta
+
+import requests.adapters
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    Adapter with a default timeout. If a base url is given, all requests are sent to that server instead, e.g. the
+    replay server (see replay_server.py). The responses keep the original url.
+    """
+
+    def __init__(self, timeout=None, *args, base_url=None, **kwargs):
+        self.timeout = timeout
+        self.base_url = base_url
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        if 'timeout' not in kwargs or kwargs['timeout'] is None:
+            kwargs['timeout'] = self.timeout
+        if self.base_url is None:
+            return super().send(request, *args, **kwargs)
+
+        from replay_server import server_url
+
+        url = request.url
+        request.url = server_url(url, self.base_url)
+        try:
+            response = super().send(request, *args, **kwargs)
+        finally:
+            request.url = url
+        response.url = url
+        return response
+
+
+class CachingHTTPAdapter(TimeoutHTTPAdapter):
+    """
+    Adapter that revalidates GET requests against an HTTPCache. If a cached response exists, its validators are sent
+    along; when the server answers 304 Not Modified, the cached body is returned as a normal 200 response with
+    `from_cache` set to True.
+    """
+
+    def __init__(self, cache=None, *args, **kwargs):
+        self.cache = cache
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        if self.cache is None or request.method != 'GET':
+            return super().send(request, *args, **kwargs)
+
+        cached = self.cache.get(request.url)
+        if cached is not None:
+            if cached.etag is not None:
+                request.headers.setdefault('If-None-Match', cached.etag)
+            if cached.last_modified is not None:
+                request.headers.setdefault('If-Modified-Since', cached.last_modified)
+
+        response = super().send(request, *args, **kwargs)
+        response.from_cache = False
+
+        if response.status_code == 304 and cached is not None:
+            headers = CaseInsensitiveDict(cached.meta['headers'])
+            headers.update(response.headers)
+            response.status_code = 200
+            response.reason = 'OK'
+            response.headers = headers
+            response.encoding = get_encoding_from_headers(headers)
+            response._content = cached.body
+            response.from_cache = True
+        elif response.status_code == 200:
+            self.cache.store(request.url, response.headers, response.content)
+
+        return response
+
+
+class RecordingAdapter(CachingHTTPAdapter):
+    """
+    Adapter that adds every response to an archive (see archive.py), so the requests can be replayed later with a
+    ReplayAdapter or the replay server.
+    :param timing: If False, the time the responses took is not recorded, so the same responses give the same archive.
+    """
+
+    def __init__(self, archive, *args, timing=True, **kwargs):
+        self.archive = archive
+        self.timing = timing
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        response = super().send(request, *args, **kwargs)
+        elapsed = response.elapsed.total_seconds() if self.timing else 0
+        self.archive.add(request.method, request.url, response.status_code, response.reason, response.headers,
+                         response.content, elapsed)
+        return response
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    """
+    Adapter that answers requests with the responses in an archive (see archive.py), without using the network.
+    A request that is not in the archive fails like a request to a server that is down.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        super().__init__()
+
+    def send(self, request, *args, **kwargs):
+        recorded = self.archive.get(request.method, request.url)
+        if recorded is None:
+            raise requests.exceptions.ConnectionError(f"Not in the archive: {request.method} {request.url}",
+                                                      request=request)
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.status_code = recorded.status
+        response.reason = recorded.reason
+        response.headers = CaseInsensitiveDict(recorded.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.elapsed = timedelta(seconds=recorded.elapsed)
+        response._content = recorded.body
+        response.from_cache = False
+        return response
+
+    def close(self):
+        pass
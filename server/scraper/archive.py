@@ -0,0 +1,132 @@
+"""
+Archives of recorded HTTP responses, so the scrapers can run without network.
+
+An archive is a folder with an index (index.json) and the bodies of the responses. The index lists the responses by
+method and url, with their status, headers and the time they took. The bodies are stored as files named after the hash
+of their content, so identical bodies are stored once. The index is sorted, so the same responses always give the same
+archive.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from httpcache import SKIPPED_HEADERS
+
+INDEX = 'index.json'
+BODIES = 'bodies'
+VERSION = 1
+# Headers that differ between otherwise identical responses, which are not recorded so archives can be compared.
+VOLATILE_HEADERS = {'age', 'date', 'expires', 'set-cookie'}
+
+
+class RecordedResponse:
+    """A response in an archive. The body is read when it is first used."""
+
+    def __init__(self, archive, entry):
+        self._archive = archive
+        self.method = entry['method']
+        self.url = entry['url']
+        self.status = entry['status']
+        self.reason = entry['reason']
+        self.headers = entry['headers']
+        self.elapsed = entry['elapsed']
+        self.digest = entry['body']
+
+    @property
+    def body(self):
+        return self._archive.read_body(self.digest)
+
+
+class Archive:
+    """
+    An archive of responses, by method and url. Responses can be added from multiple threads; the index is only written
+    by `save`.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._entries = {}
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, directory):
+        """Open an existing archive, or start a new one if the folder has no index."""
+        archive = cls(directory)
+        try:
+            with open(os.path.join(directory, INDEX), 'r') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return archive
+        if index.get('version') != VERSION:
+            raise ValueError(f"Unsupported archive version {index.get('version')} in {directory}")
+        for entry in index['responses']:
+            archive._entries[(entry['method'], entry['url'])] = entry
+        return archive
+
+    def get(self, method, url):
+        """Get the recorded response to a request, or None if it was not recorded."""
+        entry = self._entries.get((method, url))
+        return RecordedResponse(self, entry) if entry is not None else None
+
+    def responses(self):
+        return [RecordedResponse(self, entry) for _, entry in sorted(self._entries.items())]
+
+    def read_body(self, digest):
+        with self._lock:
+            body = self._bodies.get(digest)
+        if body is None:
+            with open(os.path.join(self.directory, BODIES, digest), 'rb') as f:
+                body = f.read()
+            with self._lock:
+                self._bodies[digest] = body
+        return body
+
+    def add(self, method, url, status, reason, headers, body, elapsed):
+        """
+        Add a response, replacing an earlier response to the same request. The body is written immediately.
+        :param headers: The headers of the response. The body is stored decoded, so the encoding headers are dropped, as
+                        are headers that change on every request.
+        :param elapsed: The time the response took, in seconds.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        path = os.path.join(self.directory, BODIES, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, 'wb') as f:
+                f.write(body)
+            os.replace(temporary, path)
+        entry = {
+            'method': method,
+            'url': url,
+            'status': status,
+            'reason': reason,
+            'headers': {k: v for k, v in sorted(headers.items())
+                        if k.lower() not in SKIPPED_HEADERS and k.lower() not in VOLATILE_HEADERS},
+            'body': digest,
+            'elapsed': round(elapsed, 3),
+        }
+        with self._lock:
+            self._entries[(method, url)] = entry
+            self._bodies[digest] = body
+
+    def save(self):
+        """Write the index, and remove the bodies no response uses anymore."""
+        with self._lock:
+            entries = [entry for _, entry in sorted(self._entries.items())]
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, INDEX)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump({'version': VERSION, 'responses': entries}, f, indent=1)
+            f.write('\n')
+        os.replace(temporary, path)
+
+        used = {entry['body'] for entry in entries}
+        bodies = os.path.join(self.directory, BODIES)
+        for name in os.listdir(bodies) if os.path.isdir(bodies) else []:
+            if name not in used:
+                os.remove(os.path.join(bodies, name))
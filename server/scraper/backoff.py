@@ -1,24 +1,155 @@
-import requests.adapters
-from urllib3 import Retry
+import atexit
+import collections
+import os
+import threading
+from urllib.parse import urlsplit
+
+import metrics
+from httpcache import HTTPCache
 
 TIMEOUT = 5  # Time before a request times out
 BACKOFF = 0.25  # Try 0.0s, 0.25s, 0.5s, 1s, 2s between requests
 AMOUNT = 1  # Amount of request to make before giving up
+POOL_CONNECTIONS = 4  # Amount of hosts to keep a connection pool for
+POOL_MAXSIZE = 10  # Amount of kept-alive connections per host, should be at least the amount of concurrent requests
+# If set, all requests are sent to this server instead, e.g. the replay server (see replay_server.py).
+BASE_URL = os.environ.get('HYDRA_BASE_URL')
+
+# Responses that can be revalidated are kept between runs.
+http_cache = HTTPCache()
+
+# Amount of requests made by the session, per host.
+request_counts = collections.Counter()
+_request_counts_lock = threading.Lock()
+
+
+def _count_request(response, *args, **kwargs):
+    host = urlsplit(response.url).netloc
+    with _request_counts_lock:
+        request_counts[host] += 1
+    # Reading a streamed body here would consume it.
+    size = int(response.headers.get('Content-Length', 0)) if kwargs.get('stream') else len(response.content)
+    metrics.record_request(host, response.elapsed.total_seconds(), size, getattr(response, 'from_cache', False))
+
+
+def configure(timeout=TIMEOUT, amount=AMOUNT, backoff=BACKOFF, pool_connections=POOL_CONNECTIONS,
+              pool_maxsize=POOL_MAXSIZE, cache=http_cache, base_url=BASE_URL):
+    """
+    (Re)configure the shared session. Since the scrapers import the session itself, the adapters are replaced on the
+    existing session instead of creating a new one. Open connections in the old pools are dropped.
+    Pass None as cache to always download the full responses.
+    """
+    with _session_lock:
+        _settings.update(timeout=timeout, amount=amount, backoff=backoff, pool_connections=pool_connections,
+                         pool_maxsize=pool_maxsize, cache=cache, base_url=base_url)
+        if _session is not None:
+            _mount(_session)
+
+
+def replay(directory):
+    """
+    Answer all requests of the shared session with the responses in an archive (see archive.py), instead of using the
+    network. This stays in effect when the session is configured again.
+    """
+    from archive import Archive
+
+    with _session_lock:
+        _settings['archive'] = Archive.load(directory)
+        if _session is not None:
+            _mount(_session)
+
+
+def record(directory, timing=True):
+    """
+    Add all responses of the shared session to an archive (see archive.py), which is written when the script exits.
+    Responses that are already in the archive are kept, unless they are requested again. Every response is fetched in
+    full, without the HTTP cache, so the archive can be replayed without network.
+    :param timing: If False, the time the responses took is not recorded, so the same responses give the same archive.
+    :return: The archive.
+    """
+    from archive import Archive
+
+    recording = Archive.load(directory)
+    with _session_lock:
+        _settings['recording'] = recording
+        _settings['timing'] = timing
+        if _session is not None:
+            _mount(_session)
+    atexit.register(recording.save)
+    return recording
+
+
+def add_arguments(parser):
+    """Add the options to record or replay the requests to the argument parser of a scraper."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='DIR', help='Record all responses into an archive in this folder.')
+    group.add_argument('--replay', metavar='DIR',
+                       help='Answer all requests with the responses in the archive in this folder, without network.')
+
+
+def use_arguments(args):
+    """Record or replay the requests, as given by the options of `add_arguments`."""
+    if args.record is not None:
+        record(args.record)
+    elif args.replay is not None:
+        replay(args.replay)
+
+
+def _mount(session):
+    from urllib3 import Retry
+    from adapters import CachingHTTPAdapter, RecordingAdapter, ReplayAdapter
+
+    if _settings.get('archive') is not None:
+        adapter = ReplayAdapter(_settings['archive'])
+    else:
+        retries = Retry(total=_settings['amount'], backoff_factor=_settings['backoff'])
+        options = dict(timeout=_settings['timeout'], max_retries=retries,
+                       pool_connections=_settings['pool_connections'], pool_maxsize=_settings['pool_maxsize'],
+                       base_url=_settings['base_url'])
+        if _settings.get('recording') is not None:
+            adapter = RecordingAdapter(_settings['recording'], timing=_settings['timing'], **options)
+        else:
+            adapter = CachingHTTPAdapter(cache=_settings['cache'], **options)
+    for prefix in ('http://', 'https://'):
+        session.mount(prefix, adapter)
+
+
+def get_session():
+    """Get the shared session. It is created at first use, which imports requests."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+
+            session = requests.Session()
+            session.hooks['response'].append(_count_request)
+            _mount(session)
+            _session = session
+        return _session
+
 
+class LazySession:
+    """
+    Stands in for the shared session until it is used. Importing requests takes a while, so a script that does not
+    make a request (e.g. with --help) should not create the session when it imports it.
+    """
 
-class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
-    def __init__(self, timeout=None, *args, **kwargs):
-        self.timeout = timeout
-        super().__init__(*args, **kwargs)
+    def __getattr__(self, name):
+        return getattr(get_session(), name)
 
-    def send(self, *args, **kwargs):
-        if 'timeout' not in kwargs or kwargs['timeout'] is None:
-            kwargs['timeout'] = self.timeout
-        return super().send(*args, **kwargs)
 
+def get_text(url, **kwargs):
+    """
+    Get the body of a page as text using the shared session. Unlike a bare `retry_session.get`, an error status is
+    raised as an exception. This can be used as opener for PyQuery: `pq(url=url, opener=get_text)`.
+    """
+    response = retry_session.get(url, **kwargs)
+    response.raise_for_status()
+    return response.text
 
-retry_session = requests.Session()
-retries = Retry(total=AMOUNT, backoff_factor=BACKOFF)
 
-for type in ('http://', 'https://'):
-    retry_session.mount(type, TimeoutHTTPAdapter(timeout=TIMEOUT, max_retries=retries))
+_session = None
+_session_lock = threading.Lock()
+_settings = {}
+configure()
+retry_session = LazySession()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark the startup of the scrapers with `python -X importtime`.
+
+Every scraper is started with --help in a new interpreter, which imports the scraper and its dependencies but does no
+work. This is what a run started by cron pays before it does anything. The heavy dependencies (requests, the HTML and
+XML parsers) must only be imported when they are used, so the benchmark fails if one of them is imported at startup,
+or if a scraper takes longer than the budget. Run from this folder: ./import_time.py
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+SCRAPER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The scripts, relative to the scraper folder.
+SCRIPTS = [
+    'news.py',
+    'schamper.py',
+    'urgentfm.py',
+    'daemon.py',
+    'resto/allergens.py',
+    'resto/cafetaria.py',
+    'resto/menu.py',
+    'resto/menu_manual.py',
+    'resto/pipeline.py',
+    'resto/sandwiches.py',
+]
+
+# Packages that take a while to import, and are only needed when a page is fetched or parsed.
+HEAVY = ['bs4', 'feedparser', 'htmlmin', 'lxml', 'pyquery', 'requests', 'urllib3']
+
+BUDGET = 100  # Maximal import time of a scraper in milliseconds
+
+
+def import_times(script):
+    """
+    Start a script with --help and get the imported modules.
+    :return: Dictionary of module name to the cumulative import time in microseconds. Modules imported by another
+             module are indented, like in the output of -X importtime.
+    """
+    directory, name = os.path.split(os.path.join(SCRAPER_DIRECTORY, script))
+    process = subprocess.run([sys.executable, '-X', 'importtime', name, '--help'], cwd=directory,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        times[module[1:]] = int(cumulative)
+    return times
+
+
+def startup_time(times):
+    """The import time of all modules, without those imported by Python itself at startup."""
+    # Nested imports are indented, so only top-level imports are counted.
+    return sum(cumulative for module, cumulative in times.items() if module != 'site' and module == module.lstrip())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the import time of the scrapers')
+    parser.add_argument('scripts', nargs='*', default=SCRIPTS, help='The scripts to check (default: all scrapers).')
+    parser.add_argument('--budget', type=float, default=BUDGET,
+                        help=f'Maximal import time of a scraper in milliseconds (default {BUDGET}).')
+    parser.add_argument('--repeat', type=int, default=3, help='Amount of runs per scraper; the best counts.')
+    args = parser.parse_args()
+
+    failed = False
+    for script in args.scripts:
+        runs = [import_times(script) for _ in range(args.repeat)]
+        best = min(startup_time(times) for times in runs) / 1000
+        heavy = sorted({module.strip() for module in runs[0]} & set(HEAVY))
+        problems = []
+        if best > args.budget:
+            problems.append(f"over budget of {args.budget:.0f} ms")
+        if heavy:
+            problems.append(f"imports {', '.join(heavy)}")
+        failed = failed or bool(problems)
+        print(f"{script:<22} {best:7.1f} ms  {'; '.join(problems) or 'ok'}")
+
+    sys.exit(1 if failed else 0)
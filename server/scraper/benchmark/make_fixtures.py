@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Generate the page fixtures of the benchmarks: an archive (see archive.py) with a page for every url the scrapers fetch.
+
+The pages have the structure the scrapers expect, wrapped in the layout of the UGent website, so they take about as
+long to parse as the real pages. They are generated from a fixed seed, so the archive is the same on every run. The
+Schamper feed is the one in fixtures/schamper.xml, which the benchmark of the Schamper articles uses as well.
+Run from this folder: ./make_fixtures.py
+"""
+import argparse
+import html
+import os
+import random
+import shutil
+import sys
+
+# Bad python module system
+sys.path.append('..')
+sys.path.append('../resto')
+
+import allergens
+import cafetaria
+import menu
+import news
+import sandwiches
+import schamper
+import urgentfm
+from archive import Archive
+
+ARCHIVE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pages')
+SCHAMPER_FEED = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'schamper.xml')
+
+HTML_HEADERS = {'Content-Type': 'text/html;charset=utf-8'}
+ATOM_HEADERS = {'Content-Type': 'application/atom+xml;charset=utf-8'}
+TEXT_HEADERS = {'Content-Type': 'text/plain; charset=utf-8'}
+RSS_HEADERS = {'Content-Type': 'application/rss+xml; charset=utf-8'}
+
+# Meals by kind, as they appear on the menu and in the list of allergens.
+MEALS = {
+    'vegetarisch': ['Vegetarische lasagne', 'Groentencurry met rijst', 'Kaaskroketten', 'Quiche met prei',
+                    'Pasta pesto', 'Veggie burger', 'Gegratineerde witloof', 'Risotto met paddenstoelen'],
+    'vegan': ['Falafel met hummus', 'Chili sin carne', 'Linzendahl', 'Tofu wok met noedels', 'Seitan stoofpot'],
+    'vis': ['Kabeljauw met puree', 'Zalm in papillot', 'Vispannetje', 'Hokifilet met dragonsaus', 'Pangasius',
+            'Tonijnsalade'],
+    'vlees': ['Stoofvlees', 'Balletjes in tomatensaus', 'Kip tikka masala', 'Spaghetti bolognaise',
+              'Varkensgebraad met appelmoes', 'Vol-au-vent', 'Gehaktbrood', 'Kalkoenfilet met champignonsaus',
+              'Chipolata met puree', 'Konijn met pruimen'],
+}
+SOUPS = ['Tomatensoep', 'Pompoensoep', 'Groentensoep', 'Erwtensoep', 'Wortelsoep', 'Preisoep']
+VEGETABLES = ['Wortelen', 'Boontjes', 'Rode kool', 'Spinazie', 'Broccoli', 'Erwten en wortelen', 'Witloof']
+STARCH = ['Frieten', 'Puree', 'Rijst', 'Gekookte aardappelen', 'Kroketten', 'Pasta']
+ALLERGENS = ['gluten', 'melk', 'ei', 'selder', 'mosterd', 'soja', 'sesam', 'noten', 'vis', 'schaaldieren',
+             'lupine', 'sulfiet', 'pinda', 'weekdieren']
+
+WEEKDAYS = {
+    'nl': ['maandag', 'dinsdag', 'woensdag', 'donderdag', 'vrijdag'],
+    'en': ['monday', 'tuesday', 'wednesday', 'thursday', 'friday'],
+}
+HEADINGS = {
+    'nl': {'soup': 'Soep', 'main': 'Hoofdgerecht', 'cold': 'Koude gerechten (zelf op te warmen)',
+           'vegetables': 'Groenten'},
+    'en': {'soup': 'Soup', 'main': 'Main dish', 'cold': 'Cold dishes (to heat up)', 'vegetables': 'Vegetables'},
+}
+KINDS = {'nl': {'vegan': 'veganistisch', 'vegetarisch': 'vegetarisch', 'vis': 'vis'},
+         'en': {'vegan': 'vegan', 'vegetarisch': 'vegetarian', 'vis': 'fish'}}
+WEEKS = [43, 44, 45, 46]
+
+
+def price(rng, low, high):
+    return f"€ {rng.uniform(low, high):.2f}".replace('.', ',')
+
+
+def ugent_page(title, content, rng):
+    """A page in the layout of the UGent website: a header with navigation, the content and a footer."""
+    navigation = ''.join(
+        f'<li class="nav-item"><a href="https://www.ugent.be/student/nl/{section}/{page}">{section} {page}</a></li>'
+        for section in ('studeren', 'meer-dan-studeren', 'administratie', 'onderzoek', 'internationaal', 'campus')
+        for page in range(rng.randint(18, 24)))
+    footer = ''.join(f'<li><a href="https://www.ugent.be/nl/info/{i}">Info {i}</a></li>' for i in range(40))
+    scripts = ''.join(f'<script src="https://www.ugent.be/++resource++ugent/js/bundle-{i}.js"></script>'
+                      for i in range(8))
+    return (f'<!DOCTYPE html><html lang="nl"><head><meta charset="utf-8"><title>{html.escape(title)} — Universiteit '
+            f'Gent</title><meta name="viewport" content="width=device-width, initial-scale=1">'
+            f'<link rel="stylesheet" href="https://www.ugent.be/++theme++ugent/css/screen.css">{scripts}</head>'
+            f'<body class="template-document portaltype-document"><header id="header"><nav><ul class="nav">'
+            f'{navigation}</ul></nav></header><div id="breadcrumbs"><a href="https://www.ugent.be">Home</a> / '
+            f'{html.escape(title)}</div><main><article id="content"><h1 class="documentFirstHeading">'
+            f'{html.escape(title)}</h1><div id="content-core">{content}</div></article></main>'
+            f'<footer id="footer"><ul>{footer}</ul><p>© Universiteit Gent</p></footer></body></html>')
+
+
+def day_menu(language, rng):
+    headings = HEADINGS[language]
+    soup = rng.choice(SOUPS)
+    soups = [f'{soup} - {price(rng, 0.8, 1.2)}', f'{soup} (groot) - {price(rng, 1.3, 1.8)}']
+    main = []
+    for kind, meals in MEALS.items():
+        for meal in rng.sample(meals, 2):
+            if kind in KINDS[language] and rng.random() < 0.5:
+                # The new system, with the kind after the name.
+                main.append(f'{meal} - {KINDS[language][kind]} - {price(rng, 3.5, 6.5)}')
+            else:
+                main.append(f'<strong>{meal}</strong> - {price(rng, 3.5, 6.5)}')
+    cold = [f'{meal} - {price(rng, 3.5, 5.5)}' for meal in rng.sample(MEALS['vlees'] + MEALS['vegetarisch'], 3)]
+    vegetables = rng.sample(VEGETABLES + STARCH, 4)
+    sections = [(headings['soup'], soups), (headings['main'], main), (headings['cold'], cold),
+                (headings['vegetables'], vegetables)]
+    return ''.join(f'<h3>{heading}</h3><ul>{"".join(f"<li>{item}</li>" for item in items)}</ul>'
+                   for heading, items in sections)
+
+
+def resto_pages(rng):
+    pages = {}
+    for language, overview in menu.WEEK_MENU_URL.items():
+        base = overview.rstrip('/')
+        links = [f'{base}/week{week:02d}' for week in WEEKS[:2]]
+        # A cyclus with the other weeks, the overview and the cafetaria cyclus, which are skipped.
+        links += [f'{base}/cyclusy', f'{base}/overzicht', f'{base}/cyclusc']
+        pages[overview] = ugent_page('Weekmenu', ''.join(f'<p><a href="{link}">{link}</a></p>' for link in links), rng)
+        pages[f'{base}/cyclusy'] = ugent_page('Cyclus', ''.join(
+            f'<p><a href="{base}/week{week:02d}">Week {week}</a></p>' for week in WEEKS[2:]), rng)
+        for week in WEEKS:
+            week_url = f'{base}/week{week:02d}'
+            days = WEEKDAYS[language] if week != WEEKS[-1] else WEEKDAYS[language][:3]
+            pages[week_url] = ugent_page(f'Week {week}', ''.join(
+                f'<p><a href="{week_url}/{day}.htm">{day.capitalize()}</a></p>' for day in days), rng)
+            for day in days:
+                pages[f'{week_url}/{day}.htm'] = ugent_page(day.capitalize(), day_menu(language, rng), rng)
+    return pages
+
+
+def allergens_page(rng):
+    sections = {
+        'Warme maaltijden: vegetarisch': MEALS['vegetarisch'],
+        'Warme maaltijden: vegan': MEALS['vegan'],
+        'Warme maaltijden: vis': MEALS['vis'],
+        'Warme maaltijden: vlees': MEALS['vlees'],
+        'Groenten bij warme maaltijden': VEGETABLES,
+        'Zetmeel': STARCH,
+        'Soep': SOUPS,
+        'Broodjes': [f'Broodje {i}' for i in range(60)],
+        'Desserten': [f'Dessert {i}' for i in range(40)],
+    }
+    content = ['<p>Op deze pagina vind je de allergenen in onze gerechten:</p>']
+    for section, foods in sections.items():
+        content.append(f'<h2>{section}</h2>')
+        for food in foods:
+            listed = ', '.join(rng.sample(ALLERGENS, rng.randint(1, 4)))
+            diet = ', vegetarisch' if section.endswith('vegetarisch') else ''
+            content.append(f'<p>{food}: {listed}{diet}</p>')
+    content.append('<h2>Meer info</h2><p>Vraag het aan onze medewerkers.</p>')
+    return ugent_page('Allergenen', f'<div id="parent-fieldname-text">{"".join(content)}</div>', rng)
+
+
+def sandwiches_page(rng):
+    fillings = ['kaas', 'hesp', 'sla', 'tomaat', 'ei', 'tonijn', 'kip', 'curry', 'mozzarella', 'pesto', 'rucola',
+                'brie', 'honing', 'walnoten', 'zalm', 'komkommer', 'wortel', 'hummus']
+    header = '<tr class="tabelheader"><td>Naam</td><td>Ingrediënten</td><td>Prijs</td></tr>'
+    static = ''.join(
+        f'<tr><td>Broodje {i}</td><td>{", ".join(rng.sample(fillings, 3))} en {rng.choice(fillings)}</td>'
+        f'<td>{price(rng, 2.5, 4.5)}</td></tr>' for i in range(40))
+    weekly = ''.join(
+        f'<tr><td>{day} / 10 - {day + 4} / 10</td><td>Broodje van de week {i}</td>'
+        f'<td>{", ".join(rng.sample(fillings, 4))}</td><td>{"x" if i % 3 == 0 else ""}</td></tr>'
+        for i, day in enumerate(range(1, 26, 7)))
+    bowls = ''.join(f'<tr><td>Bowl {i}</td><td>{", ".join(rng.sample(fillings, 5))}</td>'
+                    f'<td>{price(rng, 5, 7)}</td></tr>' for i in range(6))
+    content = (f'<table>{header}{static}</table><table>{header}{weekly}</table>'
+               f'<table>{header}{bowls}</table>')
+    return ugent_page('Broodjes', content, rng)
+
+
+def cafetaria_pages(rng):
+    breakfast = ''.join(f'<li>{item} - {price(rng, 0.5, 2.5)}</li>'
+                        for item in ['Koffiekoek', 'Croissant', 'Yoghurt', 'Fruitsalade', 'Pistolet', 'Muesli'])
+    drinks = ''.join(f'<li>{item} {price(rng, 0.8, 2.5)}</li>'
+                     for item in ['Water', 'Cola', 'Fruitsap', 'Koffie', 'Thee', 'Chocomelk', 'Ice tea'])
+    desserts = ''.join(f'<li>{item} {price(rng, 0.8, 2.0)}</li>'
+                       for item in ['Chocolademousse', 'Rijstpap', 'Tiramisu', 'Fruit', 'Pudding'])
+    return {
+        cafetaria.BASE_URL + 'ontbijt.htm': ugent_page('Ontbijt', f'<ul>{breakfast}</ul>', rng),
+        cafetaria.BASE_URL + 'takeawaymenudrankendesserten.htm': ugent_page(
+            'Dranken en desserten', f'<div id="parent-fieldname-text"><ul>{drinks}</ul><ul>{desserts}</ul></div>', rng),
+    }
+
+
+def atom_feed(language, rng):
+    entries = []
+    for i in range(50):
+        paragraphs = ''.join(f'<p>{html.escape(" ".join(rng.choices(ALLERGENS + SOUPS, k=40)))}</p>'
+                             for _ in range(4))
+        entries.append(
+            f'<entry><title>Nieuws {i}</title>'
+            f'<link rel="alternate" href="https://www.ugent.be/{language}/actueel/nieuws-{i}.htm"/>'
+            f'<id>https://www.ugent.be/{language}/actueel/nieuws-{i}</id>'
+            f'<published>2026-09-{1 + i % 28:02d}T09:00:00+02:00</published>'
+            f'<updated>2026-10-{1 + i % 28:02d}T10:00:00+02:00</updated>'
+            f'<summary>Samenvatting van nieuws {i}</summary>'
+            f'<content type="html">{html.escape(paragraphs)}</content></entry>')
+    return (f'<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom" xml:lang="{language}">'
+            f'<title>UGent nieuws</title><link rel="alternate" href="https://www.ugent.be/{language}/actueel"/>'
+            f'<id>https://www.ugent.be/{language}/actueel/atom.xml</id><updated>2026-10-18T08:00:00+02:00</updated>'
+            f'<logo>https://www.ugent.be/logo.png</logo><generator>Plone</generator>{"".join(entries)}</feed>')
+
+
+def urgentfm_pages(rng):
+    programme = '/programmas/ochtendshow'
+    home = (f'<html><head><title>Urgent.fm</title></head><body><div id="header-text">'
+            f'<a href="/">Urgent.fm</a> <a href="{programme}">De Ochtendshow</a></div>'
+            f'<div class="content">{"".join(f"<p>Bericht {i}</p>" for i in range(30))}</div></body></html>')
+    details = (f'<html><body><div class="content"><div class="field-name-field-radioprograms-image">'
+               f'<img src="https://urgent.fm/sites/default/files/ochtendshow.jpg"></div>'
+               f'<div class="field-type-text-with-summary"><p>Elke ochtend live vanuit de studio.</p></div>'
+               f'</div></body></html>')
+    return {
+        urgentfm.URL: home,
+        urgentfm.URL + programme: details,
+        urgentfm.LIVE_URL: 'http://stream.urgent.fm:8000/urgent_live.mp3\n',
+    }
+
+
+def generate(directory, seed):
+    rng = random.Random(seed)
+    html_pages = {}
+    html_pages.update(resto_pages(rng))
+    html_pages[allergens.URL] = allergens_page(rng)
+    html_pages[sandwiches.SANDWICHES_URL] = sandwiches_page(rng)
+    html_pages.update(cafetaria_pages(rng))
+    other_pages = urgentfm_pages(rng)
+
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    archive = Archive(directory)
+    for url, body in html_pages.items():
+        archive.add('GET', url, 200, 'OK', HTML_HEADERS, body.encode('utf-8'), 0.1)
+    for url, language in ((news.URL_NL, 'nl'), (news.URL_EN, 'en')):
+        archive.add('GET', url, 200, 'OK', ATOM_HEADERS, atom_feed(language, rng).encode('utf-8'), 0.2)
+    for url, body in other_pages.items():
+        headers = TEXT_HEADERS if url == urgentfm.LIVE_URL else HTML_HEADERS
+        archive.add('GET', url, 200, 'OK', headers, body.encode('utf-8'), 0.1)
+    with open(SCHAMPER_FEED, 'rb') as f:
+        archive.add('GET', schamper.RSS_URL, 200, 'OK', RSS_HEADERS, f.read(), 0.2)
+    archive.save()
+    return archive
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate the page fixtures of the benchmarks')
+    parser.add_argument('--output', default=ARCHIVE, help=f'The archive to write (default {ARCHIVE}).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated content (default 0).')
+    args = parser.parse_args()
+
+    generated = generate(args.output, args.seed)
+    print(f"Wrote {len(generated.responses())} pages to {args.output}")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the meal kind classifier, compared to checking every word of the vocabulary separately.
+
+Run from this folder: ./meal_kinds.py
+"""
+import argparse
+import ast
+import sys
+import timeit
+
+# Bad python module system
+sys.path.append('..')
+sys.path.append('../resto')
+
+import menu
+from classifier import Classifier
+
+MEALS = [
+    "Balletjes in tomatensaus",
+    "Kabeljauwfilet met mosterdsaus",
+    "Vegetarische lasagne",
+    "Veganistische curry met kikkererwten",
+    "Stoofvlees op Vlaamse wijze",
+    "Zalm in papillot met prei",
+    "Kip tikka masala",
+    "Pasta pesto - veggie",
+    "Hokifilet met dragonsaus",
+    "Spaghetti bolognaise",
+    "Vispannetje met kruidenkorst",
+    "Lentil burger met frietjes",
+]
+
+
+def fish_vocabulary():
+    """The vissen list of converter.py. That module cannot be imported, since it needs a writer menu.py no longer has."""
+    with open('../resto/converter.py', 'r') as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], 'id', None) == 'vissen':
+            return ast.literal_eval(node.value)
+    raise ValueError("No vissen in converter.py")
+
+
+def naive(vocabularies):
+    """Classify like before: every word is checked separately."""
+
+    def classify(name):
+        for kind, terms in vocabularies:
+            for term in terms:
+                if term.lower() in name.lower():
+                    return kind, term
+        return None, None
+
+    return classify
+
+
+def measure(classify, repeat):
+    """Time per meal in microseconds, the best of three runs."""
+    timer = timeit.Timer(lambda: [classify(meal) for meal in MEALS])
+    return min(timer.repeat(3, repeat)) / (repeat * len(MEALS)) * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the meal kind classifier')
+    parser.add_argument('--repeat', type=int, default=1000, help='Amount of times every meal is classified.')
+    args = parser.parse_args()
+
+    benchmarks = {
+        'menu.py': [
+            ('vegetarian', menu.POSSIBLE_VEGETARIAN),
+            ('vegan', menu.POSSIBLE_VEGAN),
+            ('fish', menu.POSSIBLE_FISH),
+        ],
+        'converter.py': [
+            ('vegetarian', ['veg.']),
+            ('fish', fish_vocabulary() + ['viscube', 'visstick', 'vispan', 'vispave', 'vispavé', ' msc ', ' asc ']),
+        ],
+    }
+
+    print(f"{'vocabulary':<14} {'terms':>6} {'naive':>10} {'classifier':>11}")
+    for label, vocabularies in benchmarks.items():
+        classifier = Classifier(vocabularies)
+        for meal in MEALS:
+            assert classifier.classify(meal) == naive(vocabularies)(meal), meal
+        terms = sum(len(terms) for _, terms in vocabularies)
+        before = measure(naive(vocabularies), args.repeat)
+        after = measure(classifier.classify, args.repeat)
+        print(f"{label:<14} {terms:>6} {before:>8.1f}us {after:>9.1f}us")
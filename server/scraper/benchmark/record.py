@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Record the responses of a run of the scrapers into an archive (see archive.py), e.g. to benchmark or profile the
+scrapers on real pages. The archive can be used with --replay of the scrapers, the --fixtures of scrapers.py or the
+replay server.
+
+The scrapers run with empty caches, and their output is kept in a temporary folder, so every page is fetched in full.
+By default the archive only contains the responses of this run, and the time the responses took is not recorded, so
+the same pages always give the same archive.
+Run from this folder: ./record.py ARCHIVE [--scrapers resto news schamper urgentfm]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+# The caches of the scrapers are kept apart. This must be set before the scrapers are imported.
+WORK_DIRECTORY = tempfile.mkdtemp(prefix='hydra-record-')
+os.environ['HYDRA_CACHE_DIR'] = os.path.join(WORK_DIRECTORY, 'cache')
+
+# Bad python module system
+sys.path.append('..')
+sys.path.append('../resto')
+
+import archive
+import backoff
+import memo
+import news
+import pipeline
+import schamper
+import urgentfm
+
+SCRAPERS = {
+    'resto': lambda output: pipeline.main(os.path.join(output, 'resto')),
+    'news': lambda output: news.run(os.path.join(output, 'news')),
+    'schamper': lambda output: schamper.run(os.path.join(output, 'schamper')),
+    'urgentfm': lambda output: urgentfm.run(os.path.join(output, 'urgentfm')),
+}
+DEFAULT_SCRAPERS = ['resto', 'news']
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record the responses of the scrapers into an archive')
+    parser.add_argument('archive', help='Folder of the archive. Will be created if needed.')
+    parser.add_argument('--scrapers', nargs='+', choices=list(SCRAPERS), default=DEFAULT_SCRAPERS,
+                        help=f"The scrapers to run (default: {' '.join(DEFAULT_SCRAPERS)}).")
+    parser.add_argument('--append', action='store_true',
+                        help='Keep the responses that are already in the archive, instead of replacing the archive.')
+    parser.add_argument('--timing', action='store_true', help='Record the time the responses took.')
+    args = parser.parse_args()
+
+    if not args.append:
+        try:
+            os.remove(os.path.join(args.archive, archive.INDEX))
+        except FileNotFoundError:
+            pass
+    recorded = backoff.record(args.archive, timing=args.timing)
+    # Every page must be fetched, also when it is parsed the same as before.
+    memo.enabled = False
+
+    try:
+        for name in args.scrapers:
+            print(f"Recording {name}")
+            SCRAPERS[name](os.path.join(WORK_DIRECTORY, 'output'))
+    finally:
+        shutil.rmtree(WORK_DIRECTORY, ignore_errors=True)
+
+    # The archive is also saved when the script exits, but then the summary could not be printed.
+    recorded.save()
+    print(f"Recorded {len(recorded.responses())} responses in {args.archive}")
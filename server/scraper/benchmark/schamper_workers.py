@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark transforming the articles of the Schamper feed with a number of worker processes.
+
+The parse cache is not used, so every article is transformed. Run from this folder: ./schamper_workers.py
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Bad python module system
+sys.path.append('..')
+
+import schamper
+from bs4 import BeautifulSoup
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'schamper.xml')
+
+
+def transform_all(documents, workers):
+    """Transform all articles, the way schamper.transform_feed does without cache."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        if workers == 1:
+            return list(map(schamper.transform_article, documents))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(schamper.transform_article, documents))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Schamper scraper with a number of workers')
+    parser.add_argument('--fixture', default=FIXTURE, help='The RSS feed to transform (default: the recorded feed).')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='The amounts of workers to compare.')
+    parser.add_argument('--repeat', type=int, default=3, help='Amount of runs per amount of workers; the best counts.')
+    args = parser.parse_args()
+
+    with open(args.fixture, 'r') as f:
+        feed = BeautifulSoup(f.read(), schamper.XML_PARSER)
+    root = feed.find(True)
+    articles = [schamper.standalone_item(root, item) for item in feed('item')]
+
+    print(f"{len(articles)} articles, {os.cpu_count()} CPUs")
+    expected = None
+    for workers in args.workers:
+        durations = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = transform_all(articles, workers)
+            durations.append(time.perf_counter() - start)
+        # The output must not depend on the amount of workers.
+        expected = expected or result
+        assert result == expected, f"Different result with {workers} workers"
+        print(f"{workers:>2} worker(s): {min(durations) * 1000:7.0f} ms")
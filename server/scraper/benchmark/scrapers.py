@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Benchmark the scrapers against recorded pages, without network.
+
+The pages are served from the fixtures (see make_fixtures.py) through the shared session, so a benchmark covers
+everything from the response to the output. The parse cache is disabled, and the other state of the scrapers is kept in
+a temporary folder, so every call does the full work.
+
+For every benchmark, the latency, the throughput and the peak memory allocated during a call are compared to
+the stored baseline. A fixed reference workload runs between the calls, and the latencies are scaled by its time, so
+results of a machine that is faster or busier than the one of the baseline can still be compared.
+Run from this folder: ./scrapers.py
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# The caches of the scrapers are kept apart. This must be set before the scrapers are imported.
+WORK_DIRECTORY = tempfile.mkdtemp(prefix='hydra-benchmark-')
+os.environ['HYDRA_CACHE_DIR'] = os.path.join(WORK_DIRECTORY, 'cache')
+
+# Bad python module system
+sys.path.append('..')
+sys.path.append('../resto')
+
+import allergens
+import backoff
+import cafetaria
+import memo
+import menu
+import news
+import sandwiches
+import schamper
+import urgentfm
+from bs4 import BeautifulSoup
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(DIRECTORY, 'fixtures', 'pages')
+SCHAMPER_FEED = os.path.join(DIRECTORY, 'fixtures', 'schamper.xml')
+BASELINE = os.path.join(DIRECTORY, 'baseline.json')
+
+TOLERANCE = 0.3  # Allowed slowdown or extra memory before a benchmark fails
+MIN_TIME = 1.0  # Seconds to run every benchmark
+MIN_CALLS = 5  # Minimal amount of measured calls
+
+
+class Benchmark:
+    """A function to measure. The arguments of every call are made by `setup`, which is not measured."""
+
+    def __init__(self, name, function, setup=tuple):
+        self.name = name
+        self.function = function
+        self.setup = setup
+
+    def call(self):
+        arguments = self.setup()
+        # The scrapers report their progress, which is not interesting here.
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            self.function(*arguments)
+            return time.perf_counter() - start
+
+
+def benchmarks(output):
+    """
+    All benchmarks.
+    :param output: Folder for the output of the scrapers.
+    """
+    day_url = menu.WEEK_MENU_URL['nl'] + '/week43/maandag.htm'
+    allergen_index = allergens.food_index(allergens.parse_allergens())
+
+    with open(SCHAMPER_FEED, 'r') as f:
+        feed = BeautifulSoup(f.read(), schamper.XML_PARSER)
+    article = schamper.standalone_item(feed.find(True), feed.find('item'))
+
+    def schamper_item():
+        # The item is changed by the transformation, so every call gets a new one.
+        return BeautifulSoup(article, schamper.XML_PARSER).find('item'),
+
+    def new_news_feed():
+        # Without output of a previous run, all entries are parsed.
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(output, 'nl.json'))
+        return news.URL_NL, 'nl', output
+
+    def new_urgentfm_status():
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(urgentfm.PROGRAMME_CACHE)
+        return os.path.join(output, 'urgentfm'),
+
+    return [
+        Benchmark('menu.get_weeks_html', menu.get_weeks_html, lambda: (menu.WEEK_MENU_URL['nl'],)),
+        Benchmark('menu.get_day_menu', menu.get_day_menu, lambda: ('nl', day_url, allergen_index)),
+        Benchmark('allergens.parse_allergens', allergens.parse_allergens),
+        Benchmark('sandwiches.all_sandwiches', sandwiches.all_sandwiches, lambda: (output,)),
+        Benchmark('cafetaria.get_breakfast', cafetaria.get_breakfast),
+        Benchmark('schamper.transform_item_in_feed', schamper.transform_item_in_feed, schamper_item),
+        Benchmark('news.do_run', news.do_run, new_news_feed),
+        Benchmark('urgentfm.run', urgentfm.run, new_urgentfm_status),
+    ]
+
+
+def reference_workload():
+    """Pure Python work like that of the parsers: serializing, parsing and searching text."""
+    data = [{'name': f'Broodje {i}', 'ingredients': ['kaas', 'hesp', 'sla'] * 3, 'price': i / 3} for i in range(200)]
+    text = json.dumps(data)
+    json.loads(text)
+    sorted(text.split('"'))
+    text.lower().count('kaas')
+
+
+REFERENCE = Benchmark('reference', reference_workload)
+
+
+def measure(benchmark, min_time=MIN_TIME, min_calls=MIN_CALLS):
+    """
+    Call a benchmark until it ran for at least `min_time` seconds, after one call to warm up. The reference workload
+    runs after every call.
+    :return: Dictionary with the fastest and the median latency in milliseconds, the fastest time of the reference
+             workload, the calls per second and the peak memory allocated during a call in KiB.
+    """
+    benchmark.call()
+    durations = []
+    references = []
+    while len(durations) < min_calls or sum(durations) < min_time:
+        durations.append(benchmark.call())
+        references.append(REFERENCE.call())
+
+    # Tracing the allocations slows down the call, so this is done separately.
+    tracemalloc.start()
+    try:
+        benchmark.call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'best_ms': round(min(durations) * 1000, 3),
+        'median_ms': round(statistics.median(durations) * 1000, 3),
+        'reference_ms': round(min(references) * 1000, 3),
+        'calls_per_second': round(len(durations) / sum(durations), 1),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def _slowdown(result, baseline):
+    """How much slower the machine was than for the baseline, according to the reference workload."""
+    return result['reference_ms'] / baseline['reference_ms']
+
+
+def compare(result, baseline, tolerance):
+    """
+    The ways a result is worse than its baseline, as readable strings. The fastest call is compared instead of the
+    median, since it varies less with the load of the machine.
+    """
+    if not baseline:
+        return []
+    speed = _slowdown(result, baseline)
+    regressions = []
+    for key, label, factor in (('best_ms', 'latency', speed), ('peak_kib', 'memory', 1.0)):
+        change = result[key] / (baseline[key] * factor) - 1
+        if change > tolerance:
+            regressions.append(f"{label} +{change * 100:.0f}%")
+    return regressions
+
+
+def _change(result, baseline):
+    if not baseline:
+        return 'no baseline'
+    return f"{(result['best_ms'] / (baseline['best_ms'] * _slowdown(result, baseline)) - 1) * 100:+.0f}%"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the scrapers against recorded pages')
+    parser.add_argument('names', nargs='*', help='Only run the benchmarks with these names (default: all).')
+    parser.add_argument('--fixtures', default=FIXTURES, help='The archive with the pages (default: the fixtures).')
+    parser.add_argument('--baseline', default=BASELINE, help=f'The baseline to compare to (default {BASELINE}).')
+    parser.add_argument('--save', action='store_true', help='Save the results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help=f'Allowed relative slowdown or extra memory (default {TOLERANCE}).')
+    parser.add_argument('--min-time', type=float, default=MIN_TIME,
+                        help=f'Seconds to run every benchmark (default {MIN_TIME}).')
+    args = parser.parse_args()
+
+    backoff.replay(args.fixtures)
+    memo.enabled = False
+
+    try:
+        with open(args.baseline, 'r') as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        stored = {}
+
+    results = {}
+    failed = []
+    try:
+        print(f"{'benchmark':<34} {'best':>10} {'median':>10} {'calls/s':>9} {'peak':>11}  change")
+        for selected in benchmarks(os.path.join(WORK_DIRECTORY, 'output')):
+            if args.names and selected.name not in args.names:
+                continue
+            result = measure(selected, args.min_time)
+            results[selected.name] = result
+            regressions = compare(result, stored.get(selected.name), args.tolerance)
+            if regressions:
+                failed.append(selected.name)
+            print(f"{selected.name:<34} {result['best_ms']:7.2f} ms {result['median_ms']:7.2f} ms "
+                  f"{result['calls_per_second']:9.1f} "
+                  f"{result['peak_kib']:7.0f} KiB  {_change(result, stored.get(selected.name))}"
+                  f"{'  REGRESSION: ' + ', '.join(regressions) if regressions else ''}")
+    finally:
+        shutil.rmtree(WORK_DIRECTORY, ignore_errors=True)
+
+    if args.save:
+        stored.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Saved the baseline to {args.baseline}")
+    elif failed:
+        print(f"Regressions in: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
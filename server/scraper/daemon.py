@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Run the scrapers from one long-running process, instead of starting them from cron.
+
+The scrapers are imported once and share the HTTP session, so a run does not pay for starting Python, importing the
+parsers and opening connections. The jobs are scheduled with the cron expressions of hydra.cron (see
+deploy_remote_ii.sh), so the schedule is the same as with cron. A job is not started while its previous run is still
+going, and every run starts after a random delay, so the jobs do not all hit the servers at the same moment.
+
+The state of every job (last run, duration, result) is written to a JSON file, which is shown on the admin page.
+"""
+
+import argparse
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import backoff
+import metrics
+import news
+import schamper
+import urgentfm
+import util
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# The resto scrapers expect their own folder to be importable.
+sys.path.append(os.path.join(DIRECTORY, 'resto'))
+import pipeline  # noqa: E402
+
+CRON_FILE = os.path.join(DIRECTORY, 'hydra.cron')
+STATE_FILE = os.path.join(DIRECTORY, 'daemon-state.json')
+RESTO_SCRIPT = os.path.join(DIRECTORY, 'resto.sh')
+
+WORKERS = 4  # Amount of jobs that can run at the same time
+JITTER = 30  # Maximal delay in seconds before a job starts
+CATCH_UP = 10  # Amount of missed minutes (e.g. after a suspend) that are still run
+
+# Minimum and maximum of the fields of a cron expression.
+FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+# Words in a cron command that end the arguments of the script.
+SHELL_OPERATORS = {'&&', '||', ';', '|', '&'}
+
+
+class CronSchedule:
+    """
+    The schedule of a cron expression: five fields (minute, hour, day of month, month and day of week), each with
+    numbers, ranges, steps and lists. Names of months and days are not supported.
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected five fields in cron expression {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, FIELDS))
+        # Both 0 and 7 are Sunday.
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        # Like cron, if both the day of the month and the day of the week are restricted, either one must match.
+        self.either_day = not fields[2].startswith('*') and not fields[4].startswith('*')
+
+    def matches(self, moment):
+        """Check if the schedule runs in the minute of the given datetime."""
+        return (moment.minute in self.minutes and moment.hour in self.hours and moment.month in self.months
+                and self._matches_day(moment))
+
+    def _matches_day(self, moment):
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        return (day or weekday) if self.either_day else (day and weekday)
+
+    def next_run(self, after):
+        """The first matching minute after the given datetime, or None if there is none within a year."""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = moment + timedelta(days=366)
+        # Skip whole months, days and hours that do not match, so this takes at most a few thousand steps.
+        while moment < end:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._matches_day(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        return None
+
+
+def _parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        span, _, step = part.partition('/')
+        if span == '*':
+            start, end = low, high
+        elif '-' in span:
+            start, end = (int(value) for value in span.split('-', 1))
+        else:
+            # With a step, a single value is the start of a range (e.g. 3/30 is 3-59/30).
+            start = int(span)
+            end = high if step else start
+        step = int(step) if step else 1
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"Invalid cron field {field!r}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Job:
+    """A scheduled scraper: the name of its script in hydra.cron, the schedule and the arguments of the script."""
+
+    def __init__(self, name, schedule, function, args):
+        self.name = name
+        self.schedule = schedule
+        self.function = function
+        self.args = args
+
+
+def update_link(target, link):
+    """Point a symlink to a target, like update_link in resto/all.sh."""
+    try:
+        current = os.readlink(link)
+    except OSError:
+        current = None
+    if current != target:
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(target, link)
+        util.add_to_manifest(link)
+
+
+def run_resto(internal, api, push='true'):
+    """
+    Run the resto scrapers in this process, like resto/all.sh does, and then publish the data with resto.sh.
+    The arguments are those of resto.sh.
+    """
+    internal = os.path.abspath(internal)
+    output_v1 = os.path.join(internal, '1.0')
+    output_v2 = os.path.join(internal, '2.0')
+    os.makedirs(output_v2, exist_ok=True)
+
+    # The files written in the resto data are recorded in the manifest that resto.sh publishes. The files of other jobs
+    # running at the same time are not.
+    git_dir = subprocess.run(['git', '-C', internal, 'rev-parse', '--absolute-git-dir'],
+                             check=True, capture_output=True, text=True).stdout.strip()
+    with util.record_changes(internal, os.path.join(git_dir, 'hydra-changes')):
+        update_link(os.path.join(output_v1, 'menu', str(date.today().year)), os.path.join(output_v1, 'week'))
+        _, failed = pipeline.main(output_v2)
+        if failed:
+            raise RuntimeError(f"Failed resto stages: {', '.join(failed)}")
+        update_link(os.path.join(output_v2, 'sandwiches', 'static.json'), os.path.join(output_v2, 'sandwiches.json'))
+
+    subprocess.run([RESTO_SCRIPT, internal, api, push], check=True, env=dict(os.environ, HYDRA_SKIP_SCRAPERS='1'))
+
+
+# The scripts in hydra.cron and the functions that do the same.
+JOBS = {
+    'news.py': news.run,
+    'schamper.py': schamper.run,
+    'urgentfm.py': urgentfm.run,
+    'resto.sh': run_resto,
+}
+
+
+def read_jobs(path):
+    """
+    Read the jobs from a crontab. Lines that do not run one of the known scripts are skipped. The arguments of a job are
+    the words after the script, up to the first redirection or shell operator.
+    """
+    jobs = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split(None, 5)
+            words = shlex.split(fields[5]) if len(fields) == 6 else []
+            for index, word in enumerate(words):
+                name = os.path.basename(word)
+                if name in JOBS:
+                    args = []
+                    for arg in words[index + 1:]:
+                        if arg in SHELL_OPERATORS or arg.startswith(('>', '<', '2>')):
+                            break
+                        args.append(arg)
+                    jobs.append(Job(name, CronSchedule(' '.join(fields[:5])), JOBS[name], args))
+                    break
+            else:
+                print(f"Skipping unknown job: {line}", file=sys.stderr)
+    return jobs
+
+
+class Daemon:
+    """Start the jobs of a crontab at the scheduled times. The crontab is read again when it changes."""
+
+    def __init__(self, cron_file=CRON_FILE, state_file=STATE_FILE, workers=WORKERS, jitter=JITTER):
+        self.cron_file = cron_file
+        self.state_file = state_file
+        self.jitter = jitter
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.jobs = []
+        self._cron_mtime = None
+        # A job only runs if it can take its lock, so a job never runs twice at the same time.
+        self._running = defaultdict(threading.Lock)
+        self._state = defaultdict(dict)
+        self._state_lock = threading.Lock()
+
+    def reload(self):
+        """Read the crontab again if it changed. If it cannot be read, the previous jobs are kept."""
+        try:
+            mtime = os.stat(self.cron_file).st_mtime_ns
+            if mtime == self._cron_mtime:
+                return
+            # A crontab that cannot be parsed is only reported once, until it changes again.
+            self._cron_mtime = mtime
+            self.jobs = read_jobs(self.cron_file)
+        except (OSError, ValueError) as e:
+            print(f"Could not read {self.cron_file}, keeping the previous {len(self.jobs)} jobs: {e}", file=sys.stderr)
+            return
+        print(f"Loaded {len(self.jobs)} jobs from {self.cron_file}")
+
+    def _update(self, job, **values):
+        next_run = _iso(job.schedule.next_run(datetime.now()))
+        with self._state_lock:
+            state = self._state[job.name]
+            state.update(values, schedule=job.schedule.expression, args=job.args, next_run=next_run)
+            snapshot = {
+                'updated': _iso(datetime.now()),
+                'pid': os.getpid(),
+                'jobs': {name: dict(job_state) for name, job_state in self._state.items()},
+            }
+            temporary = f"{self.state_file}.{os.getpid()}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(snapshot, f, indent=2, sort_keys=True)
+            os.replace(temporary, self.state_file)
+
+    def start(self, job, jitter=True):
+        """
+        Start a job in the background after a random delay, unless it is still running.
+        :return: The future of the run if it started without delay, otherwise None.
+        """
+        lock = self._running[job.name]
+        if not lock.acquire(blocking=False):
+            print(f"{job.name} is still running, skipping this run")
+            with self._state_lock:
+                skipped = self._state[job.name].get('skipped', 0) + 1
+            self._update(job, skipped=skipped)
+            return None
+        self._update(job, status='waiting')
+        delay = random.uniform(0, self.jitter) if jitter else 0
+        if not delay:
+            return self._submit(job, lock)
+        # The job only takes a worker when it starts, so waiting jobs do not hold up other jobs.
+        timer = threading.Timer(delay, self._submit, (job, lock))
+        timer.daemon = True
+        timer.start()
+        return None
+
+    def _submit(self, job, lock):
+        try:
+            return self.executor.submit(self._run, job, lock)
+        except RuntimeError:
+            # The daemon is stopping.
+            lock.release()
+            return None
+
+    def _run(self, job, lock):
+        try:
+            print(f"Starting {job.name} {' '.join(job.args)}")
+            start = time.time()
+            self._update(job, status='running', last_start=_iso(datetime.fromtimestamp(start)))
+            # noinspection PyBroadException
+            try:
+                with metrics.Run(os.path.splitext(job.name)[0]):
+                    job.function(*job.args)
+                status, error = 'ok', None
+            except BaseException as exception:
+                # Scrapers exit with SystemExit on some errors; that must not stop the daemon.
+                traceback.print_exc()
+                status, error = 'failed', f"{type(exception).__name__}: {exception}"
+            end = time.time()
+            print(f"Finished {job.name}: {status} in {end - start:.1f}s")
+            self._update(job, status=status, error=error, last_end=_iso(datetime.fromtimestamp(end)),
+                         duration=round(end - start, 3))
+        finally:
+            lock.release()
+
+    def tick(self, moment):
+        """Start the jobs scheduled in the minute of the given datetime."""
+        self.reload()
+        for job in self.jobs:
+            if job.schedule.matches(moment):
+                self.start(job)
+
+    def run_forever(self):
+        last = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=1)
+        while True:
+            now = datetime.now().replace(second=0, microsecond=0)
+            # Normally this is one minute, but run missed minutes too, e.g. if the clock jumped.
+            moment = max(last + timedelta(minutes=1), now - timedelta(minutes=CATCH_UP))
+            while moment <= now:
+                self.tick(moment)
+                moment += timedelta(minutes=1)
+            last = now
+            time.sleep(max(0.0, (now + timedelta(minutes=1) - datetime.now()).total_seconds()))
+
+
+def _iso(moment):
+    return moment.isoformat(timespec='seconds') if moment is not None else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the scrapers on the schedule of a crontab')
+    parser.add_argument('--cron', default=CRON_FILE, help=f'The crontab with the schedule (default {CRON_FILE}).')
+    parser.add_argument('--state', default=STATE_FILE,
+                        help=f'Where to write the state of the jobs (default {STATE_FILE}).')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help=f'Amount of jobs that can run at the same time (default {WORKERS}).')
+    parser.add_argument('--jitter', type=float, default=JITTER,
+                        help=f'Maximal delay in seconds before a job starts (default {JITTER}).')
+    parser.add_argument('--list', action='store_true', help='List the jobs and when they run next, then exit.')
+    parser.add_argument('--run', metavar='JOB', help='Run one job (e.g. news.py) now, then exit.')
+    args = parser.parse_args()
+
+    # Keep a warm connection for every menu worker and the other jobs.
+    backoff.configure(pool_maxsize=max(pipeline.menu.WORKERS + args.workers, backoff.POOL_MAXSIZE))
+
+    daemon = Daemon(args.cron, args.state, args.workers, args.jitter)
+    daemon.reload()
+    if args.list:
+        for scheduled in daemon.jobs:
+            next_run = _iso(scheduled.schedule.next_run(datetime.now()))
+            arguments = ' '.join(scheduled.args)
+            print(f"{scheduled.schedule.expression:<16} {scheduled.name:<12} next {next_run}  {arguments}")
+    elif args.run:
+        matching = [scheduled for scheduled in daemon.jobs if scheduled.name == args.run]
+        if not matching:
+            print(f"No job {args.run} in {args.cron}", file=sys.stderr)
+            sys.exit(1)
+        daemon.start(matching[0], jitter=False).result()
+        daemon.executor.shutdown()
+        sys.exit(0 if daemon._state[args.run].get('status') == 'ok' else 1)
+    else:
+        try:
+            daemon.run_forever()
+        except KeyboardInterrupt:
+            print("Stopping, waiting for running jobs to finish")
+            daemon.executor.shutdown(cancel_futures=True)
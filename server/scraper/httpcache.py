@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Persistent HTTP cache for the scrapers.
+
+Responses with an ETag or Last-Modified header are kept on disk, so the next run can send a conditional request and
+reuse the body when the server answers with 304 Not Modified. The cache is used by the shared session in backoff.py.
+When the cache grows larger than its maximum size, the least recently used entries are removed until it is well
+below that size again.
+
+Run this file to inspect or purge the cache.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from util import cache_path
+
+DIRECTORY = cache_path('http')
+MAX_SIZE = 64 * 1024 * 1024  # Bytes of bodies to keep before evicting
+EVICT_TO = 0.75  # Fraction of the maximum size to keep when evicting, so the cache is not listed again right away
+
+# The body is stored decoded, so these headers no longer apply to it.
+SKIPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+class CacheEntry:
+    """A cached response: the metadata (url, validators, headers) and the body."""
+
+    def __init__(self, meta, body):
+        self.meta = meta
+        self.body = body
+
+    @property
+    def etag(self):
+        return self.meta.get('etag')
+
+    @property
+    def last_modified(self):
+        return self.meta.get('last_modified')
+
+
+class HTTPCache:
+    """
+    An on-disk cache of response bodies. Every entry is a pair of files, named after the hash of the URL: a JSON file
+    with the metadata and a file with the raw body. The modification time of the metadata file is the last time the
+    entry was used.
+    """
+
+    def __init__(self, directory=DIRECTORY, max_size=MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # Total size of the bodies. It is counted at the first store and then kept up to date, so the entries are only
+        # listed again when the cache is too large.
+        self._size = None
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.json', base + '.body'
+
+    def get(self, url):
+        """Get the entry for the url, or None if there is none. This marks the entry as used."""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return CacheEntry(meta, body)
+
+    def store(self, url, headers, body):
+        """Store a response. Responses without validators cannot be revalidated and are not stored."""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag is None and last_modified is None:
+            return
+        meta = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'headers': {k: v for k, v in headers.items() if k.lower() not in SKIPPED_HEADERS},
+            'size': len(body),
+        }
+        meta_path, body_path = self._paths(url)
+        try:
+            replaced = os.path.getsize(body_path)
+        except OSError:
+            replaced = 0
+        os.makedirs(self.directory, exist_ok=True)
+        # Write the body first: a metadata file always has a complete body next to it.
+        _write_atomic(body_path, body)
+        _write_atomic(meta_path, json.dumps(meta, sort_keys=True).encode('utf-8'))
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(meta['size'] for meta in self.entries())
+            else:
+                self._size += len(body) - replaced
+            too_large = self._size > self.max_size
+        if too_large:
+            self.evict()
+
+    def entries(self):
+        """List the metadata of all entries, most recently used first. The last use is added as 'used'."""
+        result = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return result
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'r') as f:
+                    meta = json.load(f)
+                meta['used'] = os.stat(path).st_mtime
+            except (OSError, ValueError):
+                continue
+            result.append(meta)
+        return sorted(result, key=lambda m: m['used'], reverse=True)
+
+    def remove(self, url):
+        """Remove the entry for the url. Returns True if there was one."""
+        meta_path, body_path = self._paths(url)
+        # Remove the metadata first: a metadata file always has a complete body next to it.
+        try:
+            os.remove(meta_path)
+            removed = True
+        except FileNotFoundError:
+            removed = False
+        try:
+            os.remove(body_path)
+        except FileNotFoundError:
+            pass
+        return removed
+
+    def purge(self, urls=None):
+        """Remove the given urls, or everything if no urls are given. Returns the amount of removed entries."""
+        if urls is None:
+            urls = [meta['url'] for meta in self.entries()]
+        removed = sum(self.remove(url) for url in urls)
+        with self._lock:
+            self._size = None
+        return removed
+
+    def evict(self, fraction=EVICT_TO):
+        """Remove the least recently used entries until the cache fits in the given fraction of its maximum size."""
+        with self._lock:
+            total = 0
+            kept = 0
+            for meta in self.entries():
+                total += meta['size']
+                if total > self.max_size * fraction:
+                    self.remove(meta['url'])
+                else:
+                    kept = total
+            self._size = kept
+
+
+def _write_atomic(path, data):
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _print_entries(cache):
+    for meta in cache.entries():
+        used = datetime.fromtimestamp(meta['used']).isoformat(sep=' ', timespec='seconds')
+        validator = meta['etag'] or meta['last_modified']
+        print(f"{used}  {meta['size']:>9}  {meta['url']}  ({validator})")
+
+
+def _print_stats(cache):
+    entries = cache.entries()
+    total = sum(meta['size'] for meta in entries)
+    print(f"Directory: {cache.directory}")
+    print(f"Entries:   {len(entries)}")
+    print(f"Size:      {total} of {cache.max_size} bytes")
+    if entries:
+        oldest = time.time() - entries[-1]['used']
+        print(f"Oldest:    last used {oldest / 3600:.1f} hours ago")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or purge the scraper HTTP cache')
+    parser.add_argument('--directory', default=DIRECTORY, help=f'Cache directory (default {DIRECTORY}).')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='Show the size of the cache.')
+    commands.add_parser('list', help='List the cached urls, most recently used first.')
+    purge_parser = commands.add_parser('purge', help='Remove entries from the cache.')
+    purge_parser.add_argument('urls', nargs='*', help='The urls to remove. If none are given, everything is removed.')
+    args = parser.parse_args()
+
+    http_cache = HTTPCache(args.directory)
+    if args.command == 'stats':
+        _print_stats(http_cache)
+    elif args.command == 'list':
+        _print_entries(http_cache)
+    elif args.command == 'purge':
+        removed = http_cache.purge(args.urls or None)
+        print(f"Removed {removed} entries.", file=sys.stderr)
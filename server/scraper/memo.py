@@ -0,0 +1,165 @@
+"""
+Memoization of parse results, keyed by a hash of the page they were parsed from.
+
+Most pages are identical between runs, even if the server does not say so. Instead of parsing them again, the result
+of the previous parse is reused. The results are stored as JSON, so they must be JSON serializable.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+from util import cache_path
+
+DIRECTORY = cache_path('parsed')
+MAX_AGE = 30 * 24 * 60 * 60  # Seconds an unused result is kept
+
+# If False, results are always computed and never stored, e.g. to benchmark the parsers.
+enabled = True
+
+# Amount of hits and misses, per namespace.
+stats = collections.defaultdict(collections.Counter)
+_lock = threading.Lock()
+_pruned = set()
+_source_digests = {}
+
+
+def _source_digest(module_name):
+    """Hash of the source of a module, so results are not reused after the parser has changed."""
+    if module_name not in _source_digests:
+        path = getattr(sys.modules.get(module_name), '__file__', None)
+        try:
+            with open(path, 'rb') as f:
+                _source_digests[module_name] = hashlib.sha256(f.read()).hexdigest()
+        except (OSError, TypeError):
+            _source_digests[module_name] = ''
+    return _source_digests[module_name]
+
+
+def _key(parts, compute):
+    digest = hashlib.sha256(_source_digest(compute.__module__).encode('utf-8'))
+    for part in parts:
+        if isinstance(part, types.ModuleType):
+            part = _source_digest(part.__name__).encode('utf-8')
+        elif isinstance(part, str):
+            part = part.encode('utf-8')
+        elif not isinstance(part, bytes):
+            part = json.dumps(part, sort_keys=True, default=str).encode('utf-8')
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+def _prune(directory):
+    """Remove results that have not been used for a while."""
+    cutoff = time.time() - MAX_AGE
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _load(path):
+    """Get a stored result, or raise LookupError if there is none."""
+    try:
+        with open(path, 'r') as f:
+            result = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        raise LookupError(path)
+    return result
+
+
+def _store(namespace, directory, path, result):
+    with _lock:
+        prune = namespace not in _pruned
+        _pruned.add(namespace)
+
+    os.makedirs(directory, exist_ok=True)
+    if prune:
+        _prune(directory)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(result, f)
+    os.replace(temporary, path)
+
+
+def _count(namespace, kind, amount=1):
+    with _lock:
+        stats[namespace][kind] += amount
+
+
+def memoized(namespace, parts, compute):
+    """
+    Get the result of `compute()`, reusing a stored result if `compute` was called with the same key before.
+
+    :param namespace: The kind of result, e.g. "day_menu". Results of different namespaces are kept apart.
+    :param parts: Everything the result depends on: the page body and the other arguments of the parser. Strings and
+                  bytes are hashed as is, modules by their source; other values are hashed as JSON.
+    :param compute: Function without arguments that does the actual parsing. The source of the module that defines
+                    this function is part of the key.
+    """
+    if not enabled:
+        return compute()
+
+    directory = os.path.join(DIRECTORY, namespace)
+    path = os.path.join(directory, _key(parts, compute) + '.json')
+    try:
+        result = _load(path)
+    except LookupError:
+        pass
+    else:
+        _count(namespace, 'hit')
+        return result
+
+    result = compute()
+    _count(namespace, 'miss')
+    _store(namespace, directory, path, result)
+    return result
+
+
+def memoized_map(namespace, function, arguments, executor=None):
+    """
+    Like `map(function, arguments)`, but every result is memoized like `memoized(namespace, [argument], ...)`.
+
+    :param executor: If given, the results that are not stored yet are computed with this executor, e.g. a process
+                     pool. The results are still returned in the order of the arguments.
+    """
+    if not enabled:
+        return list(map(function, arguments))
+
+    directory = os.path.join(DIRECTORY, namespace)
+    paths = [os.path.join(directory, _key([argument], function) + '.json') for argument in arguments]
+    results = {}
+    missing = []
+    for index, path in enumerate(paths):
+        try:
+            results[index] = _load(path)
+        except LookupError:
+            missing.append(index)
+    _count(namespace, 'hit', len(results))
+
+    if executor is not None and len(missing) > 1:
+        computed = executor.map(function, [arguments[index] for index in missing])
+    else:
+        computed = map(function, [arguments[index] for index in missing])
+    for index, result in zip(missing, computed):
+        _count(namespace, 'miss')
+        _store(namespace, directory, paths[index], result)
+        results[index] = result
+
+    return [results[index] for index in range(len(arguments))]
+
+
+def summary():
+    """Human readable overview of the hits and misses."""
+    with _lock:
+        parts = [f"{namespace}: {c['hit']} hit(s), {c['miss']} miss(es)" for namespace, c in sorted(stats.items())]
+    return "Parse cache: " + ("; ".join(parts) if parts else "not used")
@@ -0,0 +1,246 @@
+"""
+Metrics of the runs of the scrapers, to find out why a run was slow or failed.
+
+During a run, the requests of the shared session are measured per host (see backoff.py), and the scrapers time their
+parsing and count the items they produce. At the end of a run, a record with these metrics, the written files and the
+duration is appended to a JSON lines file. The same metrics are written to a textfile for the textfile collector of
+the Prometheus node exporter, one file per scraper. After a successful run, the heartbeat file of the scraper is
+touched, so the admin app can check that the scraper runs on schedule: the output files keep their modification time
+if their content did not change.
+
+The metrics are kept for the whole process, like the counters in util.py and memo.py, so a run that consists of
+multiple scrapers (e.g. pipeline.py) gets a single record, with the items counted per kind.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import memo
+import util
+
+# Folder with the records of all runs, the heartbeats and the textfiles for Prometheus. It is kept outside the
+# deployment, which replaces the folder of the scrapers, so the history survives a deploy. The admin app reads it too.
+DIRECTORY = os.environ.get('HYDRA_METRICS_DIR') or os.path.join(
+    os.environ.get('XDG_STATE_HOME') or os.path.expanduser('~/.local/state'), 'hydra', 'metrics')
+RUNS_FILE = 'runs.jsonl'
+# Touched after every successful run of a scraper, also if none of its output changed (see util.write_bytes_to_file).
+HEARTBEAT_FILE = '{scraper}.heartbeat'
+QUANTILES = (0.5, 0.9, 0.99)
+
+_lock = threading.Lock()
+# The requests since the oldest active run started: host, latency, size and whether it came from the cache.
+_requests = []
+_dropped = 0  # Amount of requests removed from the start of the list
+_active = 0  # Amount of active runs
+_timings = collections.Counter()  # Seconds, per phase
+_counts = collections.Counter()
+
+
+def record_request(host, seconds, size, from_cache=False):
+    with _lock:
+        if _active:
+            _requests.append((host, seconds, size, from_cache))
+
+
+@contextlib.contextmanager
+def timer(phase):
+    """
+    Add the time spent in a block to a phase of the run, e.g. `with metrics.timer('parse'): ...`. The time is summed
+    over all threads.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        with _lock:
+            _timings[phase] += duration
+
+
+def count(kind, amount=1):
+    """Count the items of a kind the run produced, e.g. `count('menus', len(menus))`."""
+    with _lock:
+        _counts[kind] += amount
+
+
+def percentile(values, fraction):
+    """The nearest-rank percentile of a non-empty list of values."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))]
+
+
+def _http_metrics(requests):
+    by_host = collections.defaultdict(list)
+    for host, seconds, size, from_cache in requests:
+        by_host[host].append((seconds, size, from_cache))
+    result = {}
+    for host, host_requests in sorted(by_host.items()):
+        latencies = [seconds for seconds, _, _ in host_requests]
+        result[host] = {
+            'requests': len(host_requests),
+            'cached': sum(1 for _, _, from_cache in host_requests if from_cache),
+            'bytes': sum(size for _, size, _ in host_requests),
+            'latency': {
+                **{f"p{round(q * 100)}": round(percentile(latencies, q), 4) for q in QUANTILES},
+                'max': round(max(latencies), 4),
+            },
+        }
+    return result
+
+
+def _difference(after, before):
+    difference = collections.Counter(after)
+    difference.subtract(before)
+    return {key: value for key, value in sorted(difference.items()) if value}
+
+
+class Run:
+    """
+    Measure a run of a scraper. When the block ends, its record is written, also if the block raised an exception.
+    Everything that happens in the process during the block is included, so runs that overlap (e.g. jobs of the
+    daemon) share their requests and timings.
+    Extra information for the record, e.g. the timings of stages, can be added to `info`. If `error` is set, the run
+    failed, even if the block did not raise an exception.
+    :param scraper: The name of the scraper.
+    """
+
+    def __init__(self, scraper, directory=None):
+        self.scraper = scraper
+        self.directory = directory or DIRECTORY
+        self.info = {}
+        self.error = None
+        self.record = None
+
+    def __enter__(self):
+        global _active
+        with _lock:
+            _active += 1
+            self._first_request = _dropped + len(_requests)
+            self._timings = collections.Counter(_timings)
+            self._counts = collections.Counter(_counts)
+        self._files = collections.Counter(util.write_stats)
+        self._parse_cache = {namespace: collections.Counter(stats) for namespace, stats in list(memo.stats.items())}
+        self.start = time.time()
+        self._clock = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _active, _dropped
+        duration = time.perf_counter() - self._clock
+        if exc_type is not None and not (exc_type is SystemExit and not exc_value.code):
+            self.error = f"{exc_type.__name__}: {exc_value}" if str(exc_value) else exc_type.__name__
+
+        with _lock:
+            requests = _requests[self._first_request - _dropped:]
+            timings = _difference(_timings, self._timings)
+            counts = _difference(_counts, self._counts)
+            _active -= 1
+            if not _active:
+                _dropped += len(_requests)
+                _requests.clear()
+
+        http = _http_metrics(requests)
+        files = _difference(util.write_stats, self._files)
+        parse_cache = {namespace: _difference(stats, self._parse_cache.get(namespace, {}))
+                       for namespace, stats in sorted(list(memo.stats.items()))}
+        self.record = {
+            'scraper': self.scraper,
+            'start': round(self.start, 3),
+            'duration': round(duration, 4),
+            'status': 'ok' if self.error is None else 'failed',
+            'error': self.error,
+            'requests': len(requests),
+            'bytes': sum(host['bytes'] for host in http.values()),
+            'http': http,
+            'timings': {phase: round(seconds, 4) for phase, seconds in timings.items()},
+            'items': sum(counts.values()),
+            'counts': counts,
+            'files': {'written': files.get('written', 0), 'unchanged': files.get('skipped', 0)},
+            'parse_cache': {namespace: stats for namespace, stats in parse_cache.items() if stats},
+            **self.info,
+        }
+        try:
+            self.write(self.record)
+        except OSError as e:
+            print(f"Could not write the metrics of {self.scraper}: {e}", file=sys.stderr)
+        return False
+
+    def write(self, record):
+        os.makedirs(self.directory, exist_ok=True)
+        # A single write of a line to a file opened for appending is not mixed with the lines of other processes.
+        with open(os.path.join(self.directory, RUNS_FILE), 'a') as f:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+
+        # The node exporter may read the textfile at any time, so it is replaced atomically.
+        fd, temporary = tempfile.mkstemp(dir=self.directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(prometheus_text(record))
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, os.path.join(self.directory, f"hydra_{self.scraper}.prom"))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+        if record['status'] == 'ok':
+            heartbeat = os.path.join(self.directory, HEARTBEAT_FILE.format(scraper=self.scraper))
+            with open(heartbeat, 'a'):
+                os.utime(heartbeat)
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def prometheus_text(record):
+    """The metrics of a record in the Prometheus text format."""
+    scraper = record['scraper']
+    metrics = collections.defaultdict(list)
+
+    def add(name, value, **labels):
+        metrics[name].append(f"{name}{_labels(scraper=scraper, **labels)} {value}")
+
+    add('hydra_scraper_last_run_timestamp_seconds', record['start'])
+    add('hydra_scraper_last_run_success', int(record['status'] == 'ok'))
+    add('hydra_scraper_duration_seconds', record['duration'])
+    add('hydra_scraper_items', record['items'])
+    for phase, seconds in record['timings'].items():
+        add('hydra_scraper_phase_seconds', seconds, phase=phase)
+    for state, amount in record['files'].items():
+        add('hydra_scraper_files', amount, state=state)
+    for host, http in record['http'].items():
+        add('hydra_scraper_http_requests', http['requests'], host=host)
+        add('hydra_scraper_http_cached_requests', http['cached'], host=host)
+        add('hydra_scraper_http_response_bytes', http['bytes'], host=host)
+        for q in QUANTILES:
+            add('hydra_scraper_http_latency_seconds', http['latency'][f"p{round(q * 100)}"], host=host, quantile=q)
+
+    lines = []
+    for name, samples in metrics.items():
+        lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+HELP = {
+    'hydra_scraper_last_run_timestamp_seconds': 'Start of the last run of the scraper.',
+    'hydra_scraper_last_run_success': 'Whether the last run of the scraper succeeded.',
+    'hydra_scraper_duration_seconds': 'Duration of the last run of the scraper.',
+    'hydra_scraper_items': 'Amount of items produced by the last run of the scraper.',
+    'hydra_scraper_phase_seconds': 'Time spent in a phase of the last run, summed over all threads.',
+    'hydra_scraper_files': 'Output files of the last run, by whether they were written or unchanged.',
+    'hydra_scraper_http_requests': 'HTTP requests made by the last run, per host.',
+    'hydra_scraper_http_cached_requests': 'HTTP requests of the last run answered from the HTTP cache, per host.',
+    'hydra_scraper_http_response_bytes': 'Size of the response bodies of the last run, per host.',
+    'hydra_scraper_http_latency_seconds': 'Latency of the HTTP requests of the last run, per host.',
+}
@@ -3,19 +3,28 @@
 Run the UGent news scraper.
 """
 
+import io
+import json
 import os
+import re
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-import feedparser
-from requests import RequestException
-
+import backoff
+import metrics
 from backoff import retry_session
-from util import write_json_to_file
+from util import write_json_to_file, write_summary
 
 URL_NL = 'https://www.ugent.be/nl/actueel/overzicht/atom.xml'
 URL_EN = 'https://www.ugent.be/en/news-events/overview/atom.xml'
 
+ATOM_ENTRY = '{http://www.w3.org/2005/Atom}entry'
+ATOM_ID = '{http://www.w3.org/2005/Atom}id'
+ATOM_UPDATED = '{http://www.w3.org/2005/Atom}updated'
+# The start of an entry in the raw feed, to count the entries without parsing them.
+RAW_ENTRY = re.compile(rb'<entry[\s>]')
+
 
 def get_content(list_of_dicts):
     if len(list_of_dicts) == 0:
@@ -26,12 +35,111 @@ def get_content(list_of_dicts):
             return element.value
 
 
-def do_run(url, language, output):
+def entry_to_object(entry):
+    return {
+        'title': entry.title,
+        'link': entry.link,
+        'id': entry.id,
+        'summary': entry.summary,
+        'published': entry.published,
+        'updated': entry.updated,
+        'content': get_content(entry.content)
+    }
+
+
+def load_previous_entries(output_file):
+    """The entries written by the previous run, by id, in the order they were written."""
+    try:
+        with open(output_file, 'r') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {entry['id']: entry for entry in previous.get('entries', [])}
+
+
+def parse_whole_feed(content, max_entries=None):
+    """Parse the whole feed with feedparser. See parse_feed for the result."""
+    import feedparser
+
+    atom = feedparser.parse(content)
+    return atom, [entry_to_object(entry) for entry in atom.entries[:max_entries]], len(atom.entries)
+
+
+def known_entries_from(known, entry_id, amount):
+    """At most the given amount of known entries, starting at the entry with the given id."""
+    ids = list(known)
+    start = ids.index(entry_id)
+    return [known[known_id] for known_id in ids[start:start + max(amount, 0)]]
+
+
+def parse_feed(content, known, max_entries=None):
+    """
+    Parse an Atom feed entry by entry, newest first. Entries that are new or updated are parsed with feedparser,
+    together with the feed itself. At the first entry with the same id and update time as a known entry, parsing stops:
+    that entry and the ones after it are taken from the previous output, up to the amount of entries in the feed. An
+    older entry that is updated without moving to the top of the feed is thus only seen when the previous output is
+    gone. If the feed is not well-formed XML, e.g. when it uses an HTML entity that is not defined, the whole feed is
+    parsed by feedparser, which is more lenient.
+    :param content: The feed.
+    :param known: Dictionary of id to the previous output for that entry, in the order of the previous output.
+    :param max_entries: Stop after this amount of entries. If None, all entries are kept.
+    :return: The feed as parsed by feedparser, the output of every entry and the amount of parsed entries.
+    """
+    import feedparser
+    from lxml import etree
+
+    root = None
+    entries = []
+    new_entries = []
+    elements = etree.iterparse(io.BytesIO(content), events=('start', 'end'), remove_comments=True,
+                               resolve_entities=False)
+    try:
+        for event, element in elements:
+            if root is None:
+                root = element
+            if event != 'end' or element.tag != ATOM_ENTRY or element.getparent() is not root:
+                continue
+            # Keep the root small: only the feed itself and the new entries are given to feedparser.
+            root.remove(element)
+            entry_id = element.findtext(ATOM_ID)
+            previous = known.get(entry_id)
+            if previous is not None and previous['updated'].strip() == (element.findtext(ATOM_UPDATED) or '').strip():
+                # The rest of the feed was already there in the previous run.
+                limit = len(RAW_ENTRY.findall(content))
+                if max_entries is not None:
+                    limit = min(limit, max_entries)
+                entries.extend(known_entries_from(known, entry_id, limit - len(entries)))
+                break
+            entries.append(None)
+            new_entries.append(element)
+            if max_entries is not None and len(entries) >= max_entries:
+                break
+    except etree.XMLSyntaxError as e:
+        print(f"Feed is not well-formed ({e}), parsing it as a whole")
+        return parse_whole_feed(content, max_entries)
+
+    # The parser reads ahead, so after stopping early, the root can contain more (partial) entries.
+    for element in root.findall(ATOM_ENTRY):
+        root.remove(element)
+    root.extend(new_entries)
+    atom = feedparser.parse(etree.tostring(root))
+    if len(atom.entries) != len(new_entries):
+        # feedparser skipped an entry, so the entries cannot be matched. Parse the whole feed instead.
+        return parse_whole_feed(content, max_entries)
+
+    parsed = iter(atom.entries)
+    return atom, [entry if entry is not None else entry_to_object(next(parsed)) for entry in entries], len(new_entries)
+
+
+def do_run(url, language, output, max_entries=None):
     output_file = os.path.join(output, f"{language}.json")  # Output file
     # Get Atom feed.
     response = retry_session.get(url)
-    # Parse.
-    atom = feedparser.parse(response.text)
+    # Parse, reusing the entries of the previous run.
+    with metrics.timer('parse'):
+        atom, entries, parsed = parse_feed(response.content, load_previous_entries(output_file), max_entries)
+    metrics.count('entries', len(entries))
+    print(f"{language}: {parsed} new or updated entries, {len(entries) - parsed} unchanged")
 
     result = {
         'language': atom.feed.language,
@@ -41,44 +149,48 @@ def do_run(url, language, output):
         'id': atom.feed.id,
         'logo': atom.feed.logo,
         'generator': atom.feed.generator,
-        'entries': []
+        'entries': entries
     }
-    for entry in atom.entries:
-        result['entries'].append({
-            'title': entry.title,
-            'link': entry.link,
-            'id': entry.id,
-            'summary': entry.summary,
-            'published': entry.published,
-            'updated': entry.updated,
-            'content': get_content(entry.content)
-        })
 
     # Write the feed as a json file
     write_json_to_file(result, output_file)
 
 
-def run(output):
+def run(output, max_entries=None):
     """
-    Run the scraper.
+    Run the scraper. Both feeds are fetched at the same time.
     :param output: The output directory for the data.
+    :param max_entries: The maximal amount of entries per feed. If None, all entries are kept.
     """
     output_path = os.path.abspath(output)  # Like realpath
     os.makedirs(output_path, exist_ok=True)  # Like mkdir -p
 
-    do_run(URL_NL, 'nl', output_path)
-    do_run(URL_EN, 'en', output_path)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        jobs = [
+            executor.submit(do_run, URL_NL, 'nl', output_path, max_entries),
+            executor.submit(do_run, URL_EN, 'en', output_path, max_entries),
+        ]
+        for job in jobs:
+            job.result()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run UGent news scraper')
     parser.add_argument('output',
                         help='Path of the folder in which the output must be written. Will be created if needed.')
+    parser.add_argument('--max-entries', type=int, help='Maximal amount of entries per feed (default: all).')
+    backoff.add_arguments(parser)
     args = parser.parse_args()
+    backoff.use_arguments(args)
+
+    from requests import RequestException
 
     try:
-        run(args.output)
+        with metrics.Run('news'):
+            run(args.output, args.max_entries)
     except RequestException as error:
         print("Failed to run UGent news scraper", file=sys.stderr)
         print(error, file=sys.stderr)
         sys.exit(1)
+
+    print(write_summary())
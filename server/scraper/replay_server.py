@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+A local HTTP server that stands in for the websites the scrapers use, by serving the responses in an archive (see
+archive.py), e.g. the fixtures of the benchmarks.
+
+The scrapers are pointed at the server with the HYDRA_BASE_URL environment variable, e.g.
+`HYDRA_BASE_URL=http://localhost:8080 ./news.py output`. The shared session then sends every request to the server,
+with the original url in the path: https://www.ugent.be/nl becomes http://localhost:8080/https/www.ugent.be/nl.
+Use another HYDRA_CACHE_DIR as well, so the responses do not end up in the real HTTP cache.
+
+The server can add latency and errors, and answers conditional requests with 304 Not Modified, to test the concurrent
+and cached paths of the scrapers. Every request can be logged as a line of JSON.
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from archive import Archive
+
+DEFAULT_ARCHIVE = 'benchmark/fixtures/pages'
+PORT = 8080
+
+# Headers of the recorded responses that are set by the server itself.
+SERVER_HEADERS = {'connection', 'content-length', 'date', 'keep-alive', 'server'}
+
+
+def server_url(url, base_url):
+    """The url on the server for an original url."""
+    parts = urlsplit(url)
+    path = f"/{parts.scheme}/{parts.netloc}{parts.path or '/'}"
+    return base_url.rstrip('/') + path + (f"?{parts.query}" if parts.query else '')
+
+
+def original_url(path):
+    """The original url for a path on the server, or None if the path is not of the form /scheme/host/path."""
+    scheme, _, rest = path.lstrip('/').partition('/')
+    if scheme not in ('http', 'https') or not rest:
+        return None
+    host, slash, remainder = rest.partition('/')
+    return f"{scheme}://{host}/{remainder}" if slash else f"{scheme}://{host}/"
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Serves an archive.
+    :param latency: Average time in seconds before a response is sent.
+    :param jitter: The latency varies this many seconds around the average.
+    :param error_rate: Fraction of the requests that fail with 503 Service Unavailable.
+    :param etags: If True, responses without validators get an ETag, so they can be revalidated.
+    :param log: File to write a line of JSON to for every request, or None.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, archive, latency=0.0, jitter=0.0, error_rate=0.0, etags=True, log=None, seed=None):
+        super().__init__(address, ReplayHandler)
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.etags = etags
+        self.log = log
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, delay))
+
+    def fails(self):
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+    def record(self, entry):
+        if self.log is not None:
+            with self._lock:
+                self.log.write(json.dumps(entry) + '\n')
+                self.log.flush()
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    # Keep the connection open, like the real servers do.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        start = time.perf_counter()
+        status, headers, body, url = self._respond()
+        self.server.delay()
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+        self.server.record({
+            'time': time.time(),
+            'method': self.command,
+            'url': url or self.path,
+            'status': status,
+            'bytes': len(body),
+            'duration': round(time.perf_counter() - start, 6),
+        })
+
+    do_HEAD = do_GET
+
+    def _respond(self):
+        url = original_url(self.path)
+        recorded = self.server.archive.get('GET', url) if url is not None else None
+        if recorded is None:
+            return 404, {'Content-Type': 'text/plain'}, b'Not in the archive\n', url
+        if self.server.fails():
+            return 503, {'Content-Type': 'text/plain', 'Retry-After': '1'}, b'Service unavailable\n', url
+
+        headers = {name: value for name, value in recorded.headers.items() if name.lower() not in SERVER_HEADERS}
+        lower = {name.lower(): value for name, value in headers.items()}
+        if self.server.etags and 'etag' not in lower and 'last-modified' not in lower:
+            headers['ETag'] = lower['etag'] = f'"{recorded.digest[:16]}"'
+
+        etag = lower.get('etag')
+        last_modified = lower.get('last-modified')
+        if_none_match = self.headers.get('If-None-Match')
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_none_match is not None:
+            not_modified = etag is not None and etag in [tag.strip() for tag in if_none_match.split(',')]
+        else:
+            not_modified = if_modified_since is not None and if_modified_since == last_modified
+        if not_modified:
+            validators = {name: value for name, value in headers.items() if name.lower() in ('etag', 'last-modified')}
+            return 304, validators, b'', url
+
+        return recorded.status, headers, recorded.body, url
+
+    def log_message(self, format, *args):
+        # Requests are logged as JSON by the server.
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve recorded responses in place of the websites of the scrapers')
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE, help=f'The archive to serve (default {DEFAULT_ARCHIVE}).')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default 127.0.0.1).')
+    parser.add_argument('--port', type=int, default=PORT, help=f'Port to listen on (default {PORT}).')
+    parser.add_argument('--latency', type=float, default=0.0, help='Average latency in seconds (default 0).')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Variation of the latency in seconds (default 0).')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests that fail with 503 (default 0).')
+    parser.add_argument('--no-etags', dest='etags', action='store_false',
+                        help='Do not add an ETag to responses that were recorded without validators.')
+    parser.add_argument('--log', help='Write a line of JSON for every request to this file ("-" for stdout).')
+    parser.add_argument('--seed', type=int, help='Seed for the latency and the errors, to repeat a run.')
+    args = parser.parse_args()
+
+    replayed = Archive.load(args.archive)
+    if not replayed.responses():
+        print(f"No responses in {args.archive}", file=sys.stderr)
+        sys.exit(1)
+
+    log_file = sys.stdout if args.log == '-' else open(args.log, 'a') if args.log else None
+    server = ReplayServer((args.host, args.port), replayed, args.latency, args.jitter, args.error_rate, args.etags,
+                          log_file, args.seed)
+    print(f"Serving {len(replayed.responses())} responses from {args.archive} on "
+          f"http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
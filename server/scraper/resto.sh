@@ -46,17 +46,46 @@ while [[ -h "$SOURCE" ]]; do # resolve $SOURCE until the file is no longer a sym
 done
 dir="$( cd -P "$( dirname "$SOURCE" )" >/dev/null && pwd )"
 
-"$dir/resto/all.sh" "$internal_v1" "$internal_v2"
+# The scrapers append every file they change to the manifest. It is kept in the git folder, so changes of a run that
+# failed before they were published are published by the next run.
+manifest="$(git -C "$internal" rev-parse --absolute-git-dir)/hydra-changes"
+touch "$manifest"
+
+# The scraper daemon (daemon.py) runs the scrapers itself, and only uses this script to publish the data.
+if [[ -z "${HYDRA_SKIP_SCRAPERS:-}" ]]; then
+    HYDRA_CHANGE_MANIFEST="$manifest" "$dir/resto/all.sh" "$internal_v1" "$internal_v2"
+fi
+
+# Print the changed paths in a folder, relative to that folder.
+#
+# Arguments:
+#   folder  The folder, ending in a slash.
+function changes_in() {
+    local path
+    sort -u "$manifest" | while IFS= read -r path; do
+        if [[ "$path" == "$1"* ]]; then
+            echo "${path#"$1"}"
+        fi
+    done
+}
 
 # Copy to correct server
-rsync -a "$internal_v1" "$api_v1"
-rsync -a "$internal_v2" "$api_v2"
+if [[ -d "$api_v1" && -d "$api_v2" ]]; then
+    # Only copy what changed.
+    changes_in "$internal_v1" | rsync -a --files-from=- "$internal_v1" "$api_v1"
+    changes_in "$internal_v2" | rsync -a --files-from=- "$internal_v2" "$api_v2"
+else
+    # New public folder, so copy everything.
+    rsync -a "$internal_v1" "$api_v1"
+    rsync -a "$internal_v2" "$api_v2"
+fi
 
 today=$(date +%F)
 cd "$internal"
-git add .
+changes_in "$internal/" | xargs -r -d '\n' git add --
 # The first part prevents git from committing nothing, resulting in an error
 git diff-index --quiet HEAD || git commit -m "Scraper: new data from $today"
+rm "$manifest"
 
 # Porcelain prevents git from writing non-errors to stderr, resulting in emails
 if [[ "$push" == true ]]; then
@@ -29,9 +29,23 @@ fi
 output1=$(realpath -s "$1")
 output2=$(realpath -s "$2")
 
+# Point a symlink to a target. If it changes, it is added to the change manifest (see resto.sh).
+#
+# Arguments:
+#   target  The target of the link.
+#   link    The path of the link.
+function update_link() {
+    if [[ "$(readlink "$2" || true)" != "$1" ]]; then
+        rm -f "$2"
+        ln -s "$1" "$2"
+        if [[ -n "${HYDRA_CHANGE_MANIFEST:-}" ]]; then
+            echo "$2" >> "$HYDRA_CHANGE_MANIFEST"
+        fi
+    fi
+}
+
 # Update symlink
-rm -f "$output1/week"
-ln -s "$output1/menu/$(date +%Y)" "$output1/week"
+update_link "$output1/menu/$(date +%Y)" "$output1/week"
 
 # Get the directory of this script file
 # see https://stackoverflow.com/a/246128/1831741
@@ -46,35 +60,14 @@ dir="$( cd -P "$( dirname "$SOURCE" )" >/dev/null && pwd )"
 # To prevent Python from being annoying with imports, cd into the folder
 pushd "$dir"
 
-# Run allergen scraper
-echo "Scraping allergens"
-command="$dir/allergens.py $output2"
+# Run all scrapers: allergens, menus, manual changes, sandwiches and cafetaria
+echo "Running the resto scrapers"
+command="$dir/pipeline.py $output2"
 # shellcheck disable=2086
 eval ${command}
 
-# Run scraper
-echo "Scraping all the menus"
-command="$dir/menu.py $output2"
-# shellcheck disable=2086
-eval ${command}
-
-echo "Applying manual changes"
-command="$dir/menu_manual.py $output2"
-# shellcheck disable=2086
-eval ${command}
-
-echo "Scraping sandwiches"
-command="$dir/sandwiches.py $output2"
-# shellcheck disable=2086
-eval ${command}
 # Symlink old file for compatibility reasons
-rm -f "$output2/sandwiches.json"
-ln -s "$output2/sandwiches/static.json" "$output2/sandwiches.json"
-
-echo "Finding all the desserts"
-command="$dir/cafetaria.py $output2"
-# shellcheck disable=2086
-eval ${command}
+update_link "$output2/sandwiches/static.json" "$output2/sandwiches.json"
 
 popd
 
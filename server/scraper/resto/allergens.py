@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
 import argparse
+import difflib
+import hashlib
+import json
 import os
+import re
 import sys
-from typing import Union
-
-from bs4 import BeautifulSoup, Tag
-from requests import RequestException
+import threading
+import traceback
+import unicodedata
+from collections import defaultdict
+from typing import TYPE_CHECKING, Union
 
 # Bad python module system
 sys.path.append('..')
 
+import backoff
+import memo
+import metrics
 from backoff import retry_session
-from util import write_json_to_file
+from util import write_json_to_file, write_summary
+
+if TYPE_CHECKING:
+    from bs4 import Tag
 
 URL = "https://www.ugent.be/student/nl/meer-dan-studeren/resto/allergenen"
 SKIPPED_ELEMENTS = [
@@ -19,8 +30,30 @@ SKIPPED_ELEMENTS = [
     "vegan"
 ]
 
+# Minimal similarity (between 0 and 1) of a dish and a food to use the allergens of the food.
+FUZZY_CUTOFF = 0.9
+# Maximal amount of foods a dish is compared to. The foods sharing the most words with the dish are used.
+FUZZY_CANDIDATES = 20
+# Words that say nothing about a dish.
+STOP_WORDS = {"met", "en", "in", "van", "op", "de", "het", "een", "with", "and", "of", "the", "a"}
+
+# Sections with the foods of the menus.
+RELEVANT_SECTIONS = [
+    "warme maaltijden: vegetarisch",
+    "warme maaltijden: vegan",
+    "warme maaltijden: vis",
+    "warme maaltijden: vlees",
+    "groenten bij warme maaltijden",
+    "zetmeel",
+    "soep"
+]
+
+# The last index made by food_index.
+_index = None
+_index_lock = threading.Lock()
+
 
-def get_section_indeces(raw_parts: list[Tag]) -> list[int]:
+def get_section_indeces(raw_parts: "list[Tag]") -> list[int]:
     return [idx for idx, val in enumerate(raw_parts) if val.name == "h2"]
 
 
@@ -44,7 +77,7 @@ def parse_section_item(section_item: str) -> Union[dict[str, list[str]], None]:
 
 
 def make_sections(
-        section_indices: list[int], raw_parts: list[Tag]
+        section_indices: list[int], raw_parts: "list[Tag]"
 ) -> dict[str, dict[str, list[str]]]:
     sections = dict()
 
@@ -80,8 +113,108 @@ def make_sections(
     return sections
 
 
+def normalize(name: str) -> str:
+    """Normalize the name of a food: lower case, without accents, punctuation or repeated whitespace."""
+    decomposed = unicodedata.normalize("NFKD", name.lower())
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[\W_]+", " ", without_accents).split())
+
+
+def foods_digest(foods: dict[str, list[str]]) -> str:
+    """Hash of the foods and their allergens."""
+    return hashlib.sha256(json.dumps(foods, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class AllergenIndex:
+    """
+    Find the allergens of dishes. A dish is split on "/", and every part is looked up as is, then normalized, and
+    finally compared to the foods with which it shares a word. The results are kept per dish, so every dish is only
+    looked up once, regardless of the amount of days and languages it is on.
+    """
+
+    def __init__(self, foods: dict[str, list[str]]):
+        """
+        :param foods: Dictionary of food (in lower case) to allergens.
+        """
+        self.foods = foods
+        # Results that depend on the foods can be cached with this, instead of hashing the foods every time.
+        self.digest = foods_digest(foods)
+        self._normalized = {}
+        self._words = defaultdict(set)
+        for food, food_allergens in foods.items():
+            key = normalize(food)
+            self._normalized[key] = food_allergens
+            for word in key.split():
+                if word not in STOP_WORDS:
+                    self._words[word].add(key)
+        self._found = {}
+
+    def _find_part(self, part: str) -> list[str]:
+        exact = self.foods.get(part)
+        if exact is not None:
+            return exact
+        key = normalize(part)
+        normalized = self._normalized.get(key)
+        if normalized is not None:
+            return normalized
+
+        shared = defaultdict(int)
+        for word in key.split():
+            for candidate in self._words.get(word, ()):
+                shared[candidate] += 1
+        candidates = sorted(shared, key=lambda c: (-shared[c], c))[:FUZZY_CANDIDATES]
+        close = difflib.get_close_matches(key, candidates, n=1, cutoff=FUZZY_CUTOFF)
+        return self._normalized[close[0]] if close else []
+
+    def find(self, dish: str) -> list[str]:
+        """Attempt to find the allergens for the given dish."""
+        found = self._found.get(dish)
+        if found is None:
+            found = []
+            for part in dish.lower().split("/"):
+                found += self._find_part(part.strip())
+            self._found[dish] = found
+        return list(found)
+
+
+def relevant_foods(all_allergens) -> dict[str, list[str]]:
+    """Merge the relevant sections of the allergens into one dictionary of food to allergens."""
+    foods = {}
+    try:
+        for section in RELEVANT_SECTIONS:
+            foods |= all_allergens[section]
+    except KeyError:
+        print(f"Could not find allergen section {section} in {all_allergens}.", file=sys.stderr)
+        print("Skipping allergens.", file=sys.stderr)
+        traceback.print_exc()
+    return foods
+
+
+def food_index(all_allergens) -> AllergenIndex:
+    """
+    The index of the foods in the relevant sections of the allergens.
+    The index is reused as long as the foods do not change, e.g. by the next runs of the daemon, so the dishes that were
+    looked up before are not looked up again.
+    :param all_allergens: The output of the allergen scraper, or None if there is none.
+    """
+    global _index
+    foods = relevant_foods(all_allergens) if all_allergens is not None else {}
+    digest = foods_digest(foods)
+    with _index_lock:
+        if _index is None or _index.digest != digest:
+            _index = AllergenIndex(foods)
+        return _index
+
+
 def parse_allergens():
     raw_html = retry_session.get(URL).text
+    with metrics.timer('parse'):
+        return memo.memoized("allergens", [raw_html], lambda: parse_allergens_html(raw_html))
+
+
+def parse_allergens_html(raw_html):
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(raw_html, "html.parser")
 
     content_div = soup.select_one(
@@ -118,7 +251,9 @@ def run(output):
     output_file = os.path.join(output_path, "allergens.json")  # Output file
 
     result = parse_allergens()
+    metrics.count('allergens', sum(len(section) for section in result.values()))
     write_json_to_file(result, output_file)
+    return result
 
 
 if __name__ == "__main__":
@@ -127,11 +262,19 @@ if __name__ == "__main__":
         "output",
         help="Path of the folder in which the output must be written. Will be created if needed.",
     )
+    backoff.add_arguments(parser)
     args = parser.parse_args()
+    backoff.use_arguments(args)
+
+    from requests import RequestException
 
     try:
-        run(args.output)
+        with metrics.Run('allergens'):
+            run(args.output)
     except RequestException as error:
         print("Failed to run allergens scraper", file=sys.stderr)
         print(error, file=sys.stderr)
         sys.exit(1)
+
+    print(memo.summary())
+    print(write_summary())
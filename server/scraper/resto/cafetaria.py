@@ -3,22 +3,24 @@ import argparse
 import os
 import sys
 
-from requests.exceptions import ConnectionError, Timeout
-from bs4 import BeautifulSoup
-
 # Bad python module system
 sys.path.append('..')
 
+import backoff
+import metrics
 from backoff import retry_session
-from util import parse_money, write_json_to_file, split_price
+from util import parse_money, write_json_to_file, write_summary, split_price
 
 HTML_PARSER = 'lxml'
 BASE_URL = 'https://www.ugent.be/student/nl/meer-dan-studeren/resto/ophetmenu/'
 
 
 def get_breakfast():
+    from bs4 import BeautifulSoup
+
     r = retry_session.get(BASE_URL + 'ontbijt.htm')
-    soup = BeautifulSoup(r.text, HTML_PARSER)
+    with metrics.timer('parse'):
+        soup = BeautifulSoup(r.text, HTML_PARSER)
     data = []
     ul = soup.find(id="content-core").find(name="ul")
     for item in ul.find_all(name="li"):
@@ -30,8 +32,11 @@ def get_breakfast():
 
 
 def get_page(url):
+    from bs4 import BeautifulSoup
+
     r = retry_session.get(url)
-    return BeautifulSoup(r.text, HTML_PARSER)
+    with metrics.timer('parse'):
+        return BeautifulSoup(r.text, HTML_PARSER)
 
 
 def get_drinks(soup):
@@ -66,6 +71,8 @@ def main(output):
         'desserts': get_desserts(page)
     }
 
+    metrics.count('extrafood', sum(len(items) for items in result.values()))
+
     output_file = os.path.join(output, "extrafood.json")
     write_json_to_file(result, output_file)
 
@@ -74,13 +81,20 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run cafetaria scraper')
     parser.add_argument('output',
                         help='Path of the folder in which the output must be written. Will be created if needed.')
+    backoff.add_arguments(parser)
     args = parser.parse_args()
+    backoff.use_arguments(args)
 
     output_path = os.path.abspath(args.output)  # Like realpath
     os.makedirs(output_path, exist_ok=True)  # Like mkdir -p
 
+    from requests.exceptions import ConnectionError, Timeout
+
     try:
-        main(output_path)
+        with metrics.Run('cafetaria'):
+            main(output_path)
     except (ConnectionError, Timeout) as e:
         print("Failed to connect: ", e, file=sys.stderr)
         sys.exit(1)
+
+    print(write_summary())
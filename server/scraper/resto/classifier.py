@@ -0,0 +1,89 @@
+"""
+Classify meals by the words in their name.
+
+A classifier is built once from a number of vocabularies, e.g. the words indicating a vegetarian meal and the words
+indicating a fish meal. All words are compiled into one Aho-Corasick automaton, so a name is scanned once, regardless of
+the size of the vocabularies, instead of once per word.
+"""
+
+
+class Classifier:
+    """
+    Find the kind of a text using vocabularies of terms. Matching is case-insensitive and terms may occur anywhere in
+    the text, also inside other words.
+    """
+
+    def __init__(self, vocabularies):
+        """
+        :param vocabularies: List of (kind, terms), from the highest to the lowest priority. Within a vocabulary, the
+                             earlier terms have priority over the later ones.
+        """
+        # The automaton: for every state, the transitions, the failure state and the terms ending in this state.
+        # Terms are stored as (priority, kind, term).
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        priority = 0
+        for kind, terms in vocabularies:
+            for term in terms:
+                self._add(term.lower(), (priority, kind, term))
+                priority += 1
+        self._build()
+
+    def _add(self, word, match):
+        state = 0
+        for char in word:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        if not self._output[state]:
+            # If a term occurs twice (e.g. with another case), the first one wins.
+            self._output[state].append(match)
+
+    def _build(self):
+        """
+        Compute the failure states breadth-first, and merge the output of the failure state into every state. Then
+        follow the failure states in advance, so the transitions of every state are complete. Characters without a
+        transition go back to the initial state.
+        """
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+                queue.append(child)
+
+        self._next = [dict(self._goto[0])] + [None] * (len(self._goto) - 1)
+        for state in queue:
+            # The failure state is closer to the initial state, so its transitions are already complete.
+            transitions = dict(self._next[self._fail[state]])
+            transitions.update(self._goto[state])
+            self._next[state] = transitions
+        # Only the best match of every state is ever needed.
+        self._best = [min(output) if output else None for output in self._output]
+
+    def classify(self, text, default=None):
+        """
+        Find the term with the highest priority in the text.
+        :param text: The text to classify.
+        :param default: The kind if no term is found.
+        :return: Tuple of the kind and the matched term, or (default, None) if no term is found.
+        """
+        transitions, best_of = self._next, self._best
+        best = None
+        state = 0
+        for char in text.lower():
+            state = transitions[state].get(char, 0)
+            match = best_of[state]
+            if match is not None and (best is None or match < best):
+                best = match
+        if best is None:
+            return default, None
+        return best[1], best[2]
@@ -12,6 +12,7 @@ from collections import defaultdict
 
 sys.path.append('.')
 from menu import write_1_0, write_2_0
+from classifier import Classifier
 
 vissen = ["Aal",
           "Adderzeenaald",
@@ -494,6 +495,12 @@ vissen = ["Aal",
           "zuignapvis"
           ]
 
+# Kinds of v1 meals, which have no kind. "veg." indicates a vegetarian meal; for fish, try some common fish types.
+KIND_CLASSIFIER = Classifier([
+    ('vegetarian', ['veg.']),
+    ('fish', vissen + ['viscube', 'visstick', 'vispan', 'vispave', 'vispavé', ' msc ', ' asc ']),
+])
+
 
 def v2_to_internal(menu):
     """Convert a v2 menu object to an internal menu object"""
@@ -533,16 +540,10 @@ def v1_to_internal(menu):
         return {'open': False}
 
     def estimate_kind(name):
-        if 'veg.' in name.lower():
-            return 'vegetarian'
-        # Try some common fish types
-        others = ['viscube', 'visstick', 'vispan', 'vispave', 'vispavé', ' msc ', ' asc ']
-        if any(x.lower() in name.lower() for x in vissen + others):
-            matched = next(x for x in (vissen + others) if x.lower() in name.lower())
+        kind, matched = KIND_CLASSIFIER.classify(name, default='meat')
+        if kind == 'fish':
             print(f"Match {name} with {matched}")
-            return 'fish'
-
-        return 'meat'
+        return kind
 
     def other_to_other(meal):
         return {
@@ -2,22 +2,30 @@
 import argparse
 import collections
 import datetime
+from html import unescape
 import json
 import os
-from bs4 import BeautifulSoup
+import re
 import string
 import sys
 import traceback
-from pprint import pprint
-from typing import Dict, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
 
-from pyquery import PyQuery as pq
 
 # Bad python module system
 sys.path.append('..')
 
 # Relative import, since Python cannot handle being a script
-from util import write_json_to_file, split_price
+import backoff
+import memo
+import metrics
+from util import write_json_to_file, write_summary, split_price
+from allergens import AllergenIndex, food_index
+from classifier import Classifier
+
+# Default amount of pages that are fetched at the same time.
+WORKERS = 8
 
 # Where to write to.
 OUTFILE_2_0 = "menu/{}/{}/{}/{}.json"
@@ -96,6 +104,12 @@ POSSIBLE_VEGAN = ['veganistische', 'veganistisch', 'vegan']
 # Not all fish dishes have these. Also included are some wrong spellings.
 POSSIBLE_FISH = ['asc', 'msc', 'gap', 'hoki', 'kabeljauw', 'zalm', 'pollack', 'koolvis', 'pangasius', 'vispannetje',
                  'heek', 'pollak', 'schol', 'hocki', 'salmon', 'tilapia', 'coley', 'loin']
+# The kind of a meal without explicit kind, based on the words in its name.
+KIND_CLASSIFIER = Classifier([
+    ('vegetarian', POSSIBLE_VEGETARIAN),
+    ('vegan', POSSIBLE_VEGAN),
+    ('fish', POSSIBLE_FISH),
+])
 
 # Map headings to internal types.
 HEADING_TO_TYPE = {
@@ -134,23 +148,24 @@ HOT_COLD_MAPPING = collections.defaultdict(lambda: 'hot', {
     'cold dishes (to be heated up)': 'cold',
 })
 
-# Relevant sections from https://www.ugent.be/student/nl/meer-dan-studeren/resto/allergenen
-RELEVANT_ALLERGEN_SECTIONS = [
-    "warme maaltijden: vegetarisch",
-    "warme maaltijden: vegan",
-    "warme maaltijden: vis",
-    "warme maaltijden: vlees",
-    "groenten bij warme maaltijden",
-    "zetmeel",
-    "soep"
-]
+# Tags in the names of meals.
+TAG = re.compile(r'<[^>]*>')
+
+
+def get_page(url):
+    """Load a page as PyQuery document, using the shared session."""
+    from pyquery import PyQuery as pq
+
+    html = backoff.get_text(url)
+    with metrics.timer('parse'):
+        return pq(url=url, opener=lambda *args, **kwargs: html)
 
 
 def get_weeks_html(url):
     """
     Get the URLs to the weekly menus from the Dutch-style HTML page.
     """
-    page = pq(url=url)
+    page = get_page(url)
     # The page gives us the "cycli", which we open and parse to get the weeks.
     cycli = [link.attrib['href'] for link in page(WEEK_MENU_HTML_SELECTOR_LINKS)]
 
@@ -166,7 +181,7 @@ def get_weeks_html(url):
         if cyclus.endswith("y") or cyclus.endswith("z"):
             # When working with cycli URLs, there is another level of indirection, which
             # is not present in the regular week menus.
-            cyclus_page = pq(url=cyclus)
+            cyclus_page = get_page(cyclus)
             week_urls.extend(link.attrib['href'] for link in cyclus_page(WEEK_MENU_HTML_SELECTOR_LINKS))
         else:
             # Just append it...
@@ -215,7 +230,7 @@ def get_days(which, iso_week, url):
     }
 
     # Get content core, containing the links to the days.
-    page = pq(url=url)
+    page = get_page(url)
     links = []
     for anchor in page("#content-core a"):
         links.append(anchor.attrib["href"].lower())
@@ -229,18 +244,29 @@ def get_days(which, iso_week, url):
     return r
 
 
-def find_allergens_for_food(allergens: Dict[str, str], food: str) -> list[str]:
+def strip_tags(markup: str) -> str:
+    """Get the text of a snippet of HTML, without the tags and with the entities replaced."""
+    return unescape(TAG.sub('', markup))
+
+
+def find_allergens_for_food(allergens: AllergenIndex, food: str) -> list[str]:
     """Attempt to find the allergens for the given food."""
-    food = food.lower()
-    food_parts = [x.strip() for x in food.split("/")]
-    found = []
-    for part in food_parts:
-        found += allergens.get(part, [])
-    return found
+    return allergens.find(food)
+
+
+def get_day_menu(which, url, allergens: AllergenIndex):
+    """Parses the day menu from the given url. If the page did not change since it was last parsed, the previous
+    result is used."""
+    html = backoff.get_text(url)
+    # The result also depends on the code of the allergen index, the classifier of the meals and split_price.
+    parts = [html, which, allergens.digest, sys.modules[AllergenIndex.__module__], sys.modules[Classifier.__module__],
+             sys.modules[split_price.__module__]]
+    with metrics.timer('parse'):
+        return memo.memoized("day_menu", parts, lambda: parse_day_menu(which, html, allergens))
 
 
-def get_day_menu(which, url, allergens: Dict[str, str]):
-    """Parses the day menu from the given url."""
+def parse_day_menu(which, html, allergens: AllergenIndex):
+    """Parses the day menu from the html of the page."""
     # Assumptions:
     # - The #content-core contains only <li> items belonging to the menu and <h3> elements that indicate a type.
     # - All menu items have a price, except vegetables.
@@ -248,7 +274,9 @@ def get_day_menu(which, url, allergens: Dict[str, str]):
     # - Vegan and vegetarian is indicated by either the old system (KIND: name - price)
     #   or the new system (name - KIND - price). The kind is optional; if not present, meat is assumed (in the new
     #   system)
-    day_menu = pq(url=url)
+    from pyquery import PyQuery as pq
+
+    day_menu = pq(html, parser='html')
     vegetables = []
     meats = []
     soups = []
@@ -281,18 +309,18 @@ def get_day_menu(which, url, allergens: Dict[str, str]):
 
         if HEADING_TO_TYPE[last_heading] == 'soup':
             name, price = split_price(meal)
-            name = BeautifulSoup(name, "html.parser").get_text()
+            name = strip_tags(name)
             food_allergens = find_allergens_for_food(allergens, name)
             soups.append(dict(price=price, name=name, type='side', allergens=food_allergens))
         elif HEADING_TO_TYPE[last_heading] == 'meal soup':
             name, price = split_price(meal)
-            name = BeautifulSoup(name, "html.parser").get_text()
+            name = strip_tags(name)
             food_allergens = find_allergens_for_food(allergens, name)
             soups.append(dict(price=price, name=name, type='main', allergens=food_allergens))
         elif HEADING_TO_TYPE[last_heading] == 'meat':
             hot_cold = HOT_COLD_MAPPING[last_heading]
             name, price = split_price(meal)
-            name = BeautifulSoup(name, "html.parser").get_text()
+            name = strip_tags(name)
             if ':' in meal:  # Meat in the old way
                 kind, name = [s.strip() for s in name.split(':')]
                 kind = kind.lower()
@@ -302,8 +330,9 @@ def get_day_menu(which, url, allergens: Dict[str, str]):
             else:  # Meat in the new way
                 # If the name contains '-', it might be an indication of vegan/vegi
                 if '-' in name:
-                    kind = name.split('-')[-1].strip()
-                    stripped_name = '-'.join(name.split('-')[:-1]).strip()  # Re-join other splits
+                    stripped_name, _, kind = name.rpartition('-')
+                    kind = kind.strip()
+                    stripped_name = stripped_name.strip()
                     if kind in TRANSLATE_KIND:
                         food_allergens = find_allergens_for_food(allergens, stripped_name)
                         meats.append(dict(price=price, name=stripped_name, kind=TRANSLATE_KIND[kind], hot=hot_cold,
@@ -313,14 +342,7 @@ def get_day_menu(which, url, allergens: Dict[str, str]):
                         meats.append(dict(price=price, name=name, kind='meat', hot=hot_cold, allergens=food_allergens))
                 else:
                     # Sometimes there is vegan/vegetarian in the name, in which case they don't repeat the type.
-                    if any(possible in name.lower() for possible in POSSIBLE_VEGETARIAN):
-                        kind = 'vegetarian'
-                    elif any(possible in name.lower() for possible in POSSIBLE_VEGAN):
-                        kind = 'vegan'
-                    elif any(possible in name.lower() for possible in POSSIBLE_FISH):
-                        kind = 'fish'
-                    else:
-                        kind = 'meat'
+                    kind, _ = KIND_CLASSIFIER.classify(name, default='meat')
                     food_allergens = find_allergens_for_food(allergens, name)
                     meats.append(dict(price=price, name=name, kind=kind, hot=hot_cold, allergens=food_allergens))
         elif HEADING_TO_TYPE[last_heading] == 'vegetables':
@@ -425,90 +447,153 @@ def write_2_0(root_path, menus):
         )
 
 
-def main(output_v2):
-    """The main method."""
+def fetch_all(executor, allergens):
+    """
+    Fetch all week pages, and then all day pages, using the given executor.
 
-    # We want to include allergens, so get the allergens and a number of relevant sections.
-    # This assumes you have run the allergen scraper first!
-    allergens = {}
+    A stage is started as soon as the page it depends on is available, so the days of the first week are being
+    fetched while the later weeks are still underway. Failures are not handled here: they are kept in the futures and
+    re-raised when the result is requested.
+
+    :return: A tuple of futures (weeks per language, days per language and week, menu per language and day).
+    """
+    week_jobs = {which: executor.submit(get_weeks, which) for which in TYPES}
+    day_jobs = {}
+    menu_jobs = {}
+
+    # The stage and the language of the jobs that have not finished yet.
+    pending = {job: ('week', which) for which, job in week_jobs.items()}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for job in done:
+            stage, which = pending.pop(job)
+            if job.exception() is not None:
+                continue
+            if stage == 'week':
+                for (year, week), week_url in job.result().items():
+                    day_job = executor.submit(get_days, which, week, week_url)
+                    day_jobs[(which, year, week)] = day_job
+                    pending[day_job] = ('day', which)
+            else:
+                for day, day_url in job.result().items():
+                    if day_url is not None:
+                        menu_jobs[(which, day)] = executor.submit(get_day_menu, which, day_url, allergens)
+
+    return week_jobs, day_jobs, menu_jobs
+
+
+def load_allergens(output_v2):
+    """
+    Read the output of the allergen scraper. This assumes you have run the allergen scraper first!
+    :return: The allergens, or None if they could not be read.
+    """
     try:
         with open(f"{output_v2}/allergens.json", 'r') as allergen_file:
-            all_allergens = json.load(allergen_file)
-            for section in RELEVANT_ALLERGEN_SECTIONS:
-                allergens |= all_allergens[section]
-    except KeyError:
-        print(f"Could not find allergen section {section} in {all_allergens}.", file=sys.stderr)
-        print("Skipping allergens.", file=sys.stderr)
-        traceback.print_exc()
+            return json.load(allergen_file)
     except IOError:
         print("Could not find allergen file.", file=sys.stderr)
         print("Using a default, but this is not normal.", file=sys.stderr)
         traceback.print_exc()
+        return None
 
-    all_problems = {}
-    menus = {}
-    for which in TYPES:
-        problems = []
-        menus[which] = {}
 
-        weeks = {}
-        # noinspection PyBroadException
-        try:
-            # Get weeks. Expect at least this week (if <= friday) and the
-            # following.
-            weeks = get_weeks(which)
-        except Exception:
-            problems.append(f"Failed to parse the weekmenu on {WEEK_MENU_URL[which]}.")
-            traceback.print_exc()
-
-        for week, week_url in weeks.items():
+def main(output_v2, workers=WORKERS, all_allergens=None):
+    """
+    The main method.
+    :param output_v2: The output path for version 2.0.
+    :param workers: The amount of pages to fetch at the same time.
+    :param all_allergens: The output of the allergen scraper. If not given, it is read from the output path.
+    """
 
-            year, week = week
-            days = {}
+    # We want to include allergens, so get the allergens and a number of relevant sections.
+    if all_allergens is None:
+        all_allergens = load_allergens(output_v2)
+    allergens = food_index(all_allergens)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        week_jobs, day_jobs, menu_jobs = fetch_all(executor, allergens)
+
+        # Collect the results in the same order as they would be fetched one by one, so the problems are reported
+        # exactly as in a serial run.
+        all_problems = {}
+        menus = {}
+        for which in TYPES:
+            problems = []
+            menus[which] = {}
+
+            weeks = {}
             # noinspection PyBroadException
             try:
-                # Get days. Expect every day to be there.
-                days = get_days(which, week, week_url)
-                problems.extend([
-                    f"{day} is not available in week {week}."
-                    for day in days
-                    if days[day] is None and day >= datetime.date.today()
-                ])
+                # Get weeks. Expect at least this week (if <= friday) and the
+                # following.
+                weeks = week_jobs[which].result()
             except Exception:
-                problem = f"Failed to parse days from {week_url}."
-                problems.append(problem)
+                problems.append(f"Failed to parse the weekmenu on {WEEK_MENU_URL[which]}.")
                 traceback.print_exc()
 
-            week_dict = {}
-            for day, day_url in days.items():
-                if day_url is None:
-                    continue  # Skip unavailable days.
+            for week, week_url in weeks.items():
 
+                year, week = week
+                days = {}
                 # noinspection PyBroadException
                 try:
-                    menu = get_day_menu(which, day_url, allergens)
-                    week_dict[day] = menu
+                    # Get days. Expect every day to be there.
+                    days = day_jobs[(which, year, week)].result()
+                    problems.extend([
+                        f"{day} is not available in week {week}."
+                        for day in days
+                        if days[day] is None and day >= datetime.date.today()
+                    ])
                 except Exception:
-                    problems.append(f"Failed parsing daymenu from {day_url}.")
+                    problem = f"Failed to parse days from {week_url}."
+                    problems.append(problem)
                     traceback.print_exc()
 
-            menus[which][(year, week)] = week_dict
+                week_dict = {}
+                for day, day_url in days.items():
+                    if day_url is None:
+                        continue  # Skip unavailable days.
+
+                    # noinspection PyBroadException
+                    try:
+                        menu = menu_jobs[(which, day)].result()
+                        week_dict[day] = menu
+                    except Exception:
+                        problems.append(f"Failed parsing daymenu from {day_url}.")
+                        traceback.print_exc()
+
+                menus[which][(year, week)] = week_dict
 
-        if problems:
-            all_problems[which] = problems
+            if problems:
+                all_problems[which] = problems
 
     # Print the parsing problems.
     if all_problems:
+        from pprint import pprint
+
         pprint(all_problems, stream=sys.stderr)
 
+    metrics.count('menus', sum(len(week) for resto_menus in menus.values() for week in resto_menus.values()))
     write_2_0(output_v2, menus)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run main resto scraper')
     parser.add_argument('v2', help='Folder for v2 output. Will be created if needed.')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help=f'Amount of pages to fetch at the same time (default {WORKERS}). Use 1 to fetch serially.')
+    backoff.add_arguments(parser)
     args = parser.parse_args()
+    backoff.use_arguments(args)
 
     output_path_v2 = os.path.abspath(args.v2)  # Like realpath
 
-    main(output_path_v2)
+    # Keep a warm connection for every worker.
+    backoff.configure(pool_maxsize=max(args.workers, backoff.POOL_MAXSIZE))
+
+    with metrics.Run('menu'):
+        main(output_path_v2, args.workers)
+
+    print(f"Requests per host: {dict(backoff.request_counts)}")
+    print(memo.summary())
+    print(write_summary())
@@ -1,14 +1,27 @@
 #!/usr/bin/env python3
 import argparse
-import glob
+import hashlib
+import inspect
 import json
 import os
 import re
+import sys
 from collections import defaultdict
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta
+
+# Bad python module system
+sys.path.append('..')
+
+import metrics
+from util import write_json_to_file, write_summary
 
 OVERVIEW_COUNT = 10
 
+# Journal of the applied changes, kept next to the v2 output, so it is committed with the data but not published.
+JOURNAL = 'manual-changes.json'
+
+DAY_FILE = re.compile(r'(\d+)\.json')
+
 
 # Common things ---------------------------------------------------------------
 # See main at bottom
@@ -1055,113 +1068,196 @@ def create_changes(root_path):
 
 # Actually do things ----------------------------------------------------------
 
-def apply_existing_menus_only(output, manual_change, dates):
-    """Apply the change to only existing menus"""
-    print(f"Matching existing menus from {manual_change.resto} between {manual_change.start} to {manual_change.end}")
-    print("====================================================================")
-
-    for resto in manual_change.resto:
-        files = glob.glob(f"{output}/menu/{resto}/*/*/*.json")
-        file_pattern = re.compile(r'.*/(\d+)/(\d+)/(\d+)\.json$')
-        for path in files:
-            # Check if this file applies or not.
-            m = file_pattern.search(path.replace("\\", "/"))
-            file_date = date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
-            if not manual_change.is_applicable(file_date):
-                continue
-
-            with open(path, 'r') as f:
-                overview = json.loads(f.read())
-                _new_content = manual_change.replacer(path, overview)
-                dates[resto][_new_content["date"]] = _new_content
-                new_content = json.dumps(_new_content)
+class MenuIndex:
+    """
+    Index of the existing menu files, per resto and date. Only the month folders that are needed are listed, and each of
+    them only once.
+    """
 
-            with open(path, 'w') as f:
-                f.write(new_content)
+    def __init__(self, output):
+        self.output = output
+        self._months = {}
 
+    def _month(self, resto, year, month):
+        key = (resto, year, month)
+        if key not in self._months:
+            folder = f"{self.output}/menu/{resto}/{year}/{month}"
+            try:
+                names = os.listdir(folder)
+            except FileNotFoundError:
+                names = []
+            files = {}
+            for name in names:
+                m = DAY_FILE.fullmatch(name)
+                if m is not None:
+                    files[date(year, month, int(m.group(1)))] = f"{folder}/{name}"
+            self._months[key] = files
+        return self._months[key]
+
+    def existing(self, resto, start, end):
+        """Get the (date, path) of the existing menus of a resto between start and end (inclusive)."""
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            for file_date, path in sorted(self._month(resto, year, month).items()):
+                if start <= file_date <= end:
+                    yield file_date, path
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    def add(self, resto, file_date, path):
+        """Register a newly created menu file."""
+        self._month(resto, file_date.year, file_date.month)[file_date] = path
+
+
+def change_identifier(change):
+    """
+    Identify a change by its replacer, restos and range. The source of the replacer is included, so a change whose
+    replacer was edited is seen as a different change.
+    """
+    try:
+        source = inspect.getsource(change.replacer)
+    except (OSError, TypeError):
+        source = change.replacer.__name__
+    digest = hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]
+    kind = 'all' if change.all_days else 'existing'
+    return f"{change.replacer.__name__}:{'+'.join(change.resto)}:{change.start}:{change.end}:{kind}:{digest}"
 
-def apply_all_menus(output, manual_change, dates):
-    """Apply the change to all dates in the applicable range. If no menu exist for a day, it will be created."""
-    print(f"Matching all menus from {manual_change.resto} between {manual_change.start} to {manual_change.end}")
-    print("====================================================================")
 
-    for applicable_date in manual_change.date_range():
-        year = applicable_date.year
-        month = applicable_date.month
-        day = applicable_date.day
-        # Get existing file if it exists
+def plan_changes(output, index, to_apply):
+    """
+    Find the menu files every change applies to.
+    :return: Dictionary of path -> (resto, date, changes), with the changes in the order they must be applied.
+    """
+    plan = {}
+    for manual_change in to_apply:
         for resto in manual_change.resto:
-            path = f"{output}/menu/{resto}/{year}/{month}/{day}.json"
-            try:
-                with open(path, 'r') as f:
-                    menu = json.loads(f.read())
-            except IOError:
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-                menu = {'open': False, 'date': applicable_date.strftime('%Y-%m-%d'), 'meals': [], 'vegetables': []}
-
-            # Apply the changes
-            _new_content = manual_change.replacer(path, menu)
-            dates[resto][_new_content["date"]] = _new_content
-            new_content = json.dumps(_new_content)
+            if manual_change.all_days:
+                targets = [(d, f"{output}/menu/{resto}/{d.year}/{d.month}/{d.day}.json")
+                           for d in manual_change.date_range()]
+            else:
+                targets = list(index.existing(resto, manual_change.start, manual_change.end))
+            for file_date, path in targets:
+                plan.setdefault(path, (resto, file_date, []))[2].append(manual_change)
+                if manual_change.all_days:
+                    # The file will exist once this change is applied, so later changes will see it.
+                    index.add(resto, file_date, path)
+    return plan
+
+
+def load_journal(path):
+    """Load the journal of applied changes, or an empty one if there is none."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main(output, journal_path=None, force=False):
+    """
+    Apply the manual changes.
 
-            with open(path, 'w+') as f:
-                f.write(new_content)
+    A journal records which changes were applied to every file and the hash of the result. A file is only rewritten if
+    it no longer has that hash (the menu scraper wrote it again) or if a change was added since.
 
+    :param output: Folder of the v2 output.
+    :param journal_path: Location of the journal. By default, the journal is kept next to the v2 output.
+    :param force: Ignore the journal and apply all changes again.
+    """
+    if journal_path is None:
+        journal_path = os.path.join(os.path.dirname(os.path.abspath(output)), JOURNAL)
+    journal = {} if force else load_journal(journal_path)
+    new_journal = {}
 
-def main(output):
     to_apply = create_changes(output)
+    identifiers = {id(change): change_identifier(change) for change in to_apply}
+    plan = plan_changes(output, MenuIndex(output), to_apply)
 
+    today = date.today()
     dates = defaultdict(dict)
-    for manual_change in to_apply:
-        if manual_change.all_days:
-            apply_all_menus(output, manual_change, dates)
+    updated = 0
+    for path, (resto, file_date, changes) in plan.items():
+        applied = [identifiers[id(change)] for change in changes]
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+        except IOError:
+            raw = None
+
+        key = os.path.relpath(path, output)
+        entry = journal.get(key)
+        if entry is not None and raw is not None and entry['hash'] == hashlib.sha256(raw).hexdigest():
+            done = entry['changes']
+            if done == applied:
+                # Nothing changed since the last run. The overview still needs the coming days.
+                new_journal[key] = entry
+                if file_date >= today:
+                    menu = json.loads(raw)
+                    dates[resto][menu["date"]] = menu
+                continue
+            if applied[:len(done)] == done:
+                # Only apply the changes that were added since.
+                changes = changes[len(done):]
+
+        if raw is not None:
+            menu = json.loads(raw)
         else:
-            apply_existing_menus_only(output, manual_change, dates)
+            menu = {'open': False, 'date': file_date.strftime('%Y-%m-%d'), 'meals': [], 'vegetables': []}
 
-    for manual_change in to_apply:
-        print("Rebuilding overviews")
-        for resto in manual_change.resto:
-            match_glob = f"menu/{resto}/overview.json"
-            print(match_glob)
-            overviews = glob.glob(f"{output}/{match_glob}")
-
-            # For each overview that should be rebuild
-            for path in overviews:
-                print(f"Rebuilding {path}")
-                new_overview = []
-                with open(path, 'r') as f:
-                    overview = json.loads(f.read())
-
-                last_day = None
-                # If the date is modified, replace it
-                for day in overview:
-                    if day["date"] in dates[resto]:
-                        print(f"Updating {day['date']}")
-                        new_overview.append(dates[resto][day["date"]])
-                    else:
-                        print(f"Keeping {day['date']}")
-                        new_overview.append(day)
-                    last_day = day["date"]
-
-                # We want to provide at least ten days in the future.
-                to_add = max(OVERVIEW_COUNT - len(overview), 0)
-                if last_day:
-                    last_day = datetime.strptime(last_day, '%Y-%m-%d').date()
-                for day in dates[resto]:
-                    dday = datetime.strptime(day, '%Y-%m-%d').date()
-                    if ((last_day and dday <= last_day) or (last_day is None and dday < date.today())) or to_add <= 0:
-                        continue
-                    new_overview.append(dates[resto][day])
-                    to_add -= 1
-
-                with open(path, 'w') as f:
-                    f.write(json.dumps(new_overview))
-                    print("Wrote updated overview")
+        print(f"Applying {len(changes)} change(s) to {path}")
+        for manual_change in changes:
+            menu = manual_change.replacer(path, menu)
+        dates[resto][menu["date"]] = menu
+
+        write_json_to_file(menu, path, sort_keys=False)
+        new_journal[key] = {
+            'hash': hashlib.sha256(json.dumps(menu).encode('utf-8')).hexdigest(),
+            'changes': applied,
+        }
+        updated += 1
+
+    print(f"Applied changes to {updated} file(s), {len(plan) - updated} file(s) were up to date.")
+    metrics.count('manual_changes', updated)
+    write_json_to_file(new_journal, journal_path)
+
+    for resto in sorted(dates):
+        rebuild_overview(output, resto, dates[resto])
+
+
+def rebuild_overview(output, resto, changed):
+    """
+    Replace the changed days in the overview of a resto. Like the menu scraper, the overview contains the first
+    OVERVIEW_COUNT days from today on.
+    :param output: Folder of the v2 output.
+    :param resto: The resto of the overview.
+    :param changed: Dictionary of date -> menu of the days the changes were applied to.
+    """
+    today = date.today().strftime('%Y-%m-%d')
+    upcoming = {day: menu for day, menu in changed.items() if day >= today}
+    if not upcoming:
+        return
+
+    path = f"{output}/menu/{resto}/overview.json"
+    try:
+        with open(path, 'r') as f:
+            overview = json.load(f)
+    except IOError:
+        return
+
+    days = {day["date"]: day for day in overview if day["date"] >= today}
+    days.update(upcoming)
+    new_overview = [days[day] for day in sorted(days)][:OVERVIEW_COUNT]
+    if write_json_to_file(new_overview, path, sort_keys=False):
+        print(f"Rebuilt {path}")
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Apply manual corrections to scraped menu')
     parser.add_argument('output', help='Folder of v2 output.')
+    parser.add_argument('--journal', help='Journal of the applied changes (default: next to the v2 output).')
+    parser.add_argument('--all', action='store_true',
+                        help='Ignore the journal and apply all changes again, e.g. after restoring old menus.')
     args = parser.parse_args()
 
-    main(args.output)
+    with metrics.Run('menu_manual'):
+        main(args.output, args.journal, args.all)
+    print(write_summary())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Run all resto scrapers in one process.
+
+The scrapers share one session, and data is passed along in memory instead of through files. The allergens, sandwiches
+and cafetaria do not depend on each other, so they run at the same time. The menus need the allergens, and the manual
+changes are applied to the menus, so those two run after the allergens.
+"""
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Bad python module system
+sys.path.append('..')
+
+import allergens
+import backoff
+import cafetaria
+import memo
+import menu
+import metrics
+import menu_manual
+import sandwiches
+from util import write_summary
+
+
+def timed(timings, name, function, *args):
+    """Run a stage and record how long it took."""
+    print(f"Running {name}")
+    start = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def main(output_v2, workers=menu.WORKERS):
+    """
+    Run all stages.
+    :param output_v2: The output path for version 2.0.
+    :param workers: The amount of menu pages to fetch at the same time.
+    :return: The duration of every stage and a list of failed stages.
+    """
+    timings = {}
+    failed = []
+
+    def wait_for(name, job):
+        # noinspection PyBroadException
+        try:
+            return job.result()
+        except Exception:
+            print(f"The {name} stage failed.", file=sys.stderr)
+            traceback.print_exc()
+            failed.append(name)
+            return None
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        independent = {
+            'allergens': executor.submit(timed, timings, 'allergens', allergens.run, output_v2),
+            'sandwiches': executor.submit(timed, timings, 'sandwiches', sandwiches.all_sandwiches, output_v2),
+            'cafetaria': executor.submit(timed, timings, 'cafetaria', cafetaria.main, output_v2),
+        }
+
+        # The menus only need the allergens, so start while the others are still running.
+        all_allergens = wait_for('allergens', independent.pop('allergens'))
+        if all_allergens is not None:
+            wait_for('menu', executor.submit(timed, timings, 'menu', menu.main, output_v2, workers, all_allergens))
+            if 'menu' not in failed:
+                wait_for('manual changes', executor.submit(timed, timings, 'manual changes', menu_manual.main,
+                                                           output_v2))
+
+        for name, job in independent.items():
+            wait_for(name, job)
+
+    return timings, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run all resto scrapers')
+    parser.add_argument('v2', help='Folder for v2 output. Will be created if needed.')
+    parser.add_argument('--workers', type=int, default=menu.WORKERS,
+                        help=f'Amount of menu pages to fetch at the same time (default {menu.WORKERS}).')
+    backoff.add_arguments(parser)
+    args = parser.parse_args()
+    backoff.use_arguments(args)
+
+    output_path_v2 = os.path.abspath(args.v2)  # Like realpath
+    os.makedirs(output_path_v2, exist_ok=True)  # Like mkdir -p
+
+    # Keep a warm connection for every menu worker and the other stages.
+    backoff.configure(pool_maxsize=max(args.workers + 2, backoff.POOL_MAXSIZE))
+
+    start = time.perf_counter()
+    with metrics.Run('resto') as current:
+        stage_timings, failed_stages = main(output_path_v2, args.workers)
+        current.info['stages'] = {stage: round(duration, 4) for stage, duration in stage_timings.items()}
+        if failed_stages:
+            current.error = f"Failed stages: {', '.join(failed_stages)}"
+    total = time.perf_counter() - start
+
+    print("Stage timings:")
+    for stage, duration in stage_timings.items():
+        print(f"    {stage:<16} {duration:6.2f}s")
+    print(f"    {'total':<16} {total:6.2f}s")
+    print(f"Requests per host: {dict(backoff.request_counts)}")
+    print(memo.summary())
+    print(write_summary())
+
+    if failed_stages:
+        print(f"Failed stages: {', '.join(failed_stages)}", file=sys.stderr)
+        sys.exit(1)
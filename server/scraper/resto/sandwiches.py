@@ -1,18 +1,20 @@
 #!/usr/bin/env python3
 import argparse
 import os
-import requests
 import re
 import datetime
 import json
 from collections import defaultdict
-from bs4 import BeautifulSoup
 
 # Bad python module system
 import sys
 sys.path.append('..')
 
-from util import parse_money, write_json_to_file
+import backoff
+import memo
+import metrics
+from backoff import retry_session
+from util import parse_money, write_json_to_file, write_summary
 
 SANDWICHES_URL = "https://www.ugent.be/student/nl/meer-dan-studeren/resto/broodjes/overzicht.htm"
 HTML_PARSER = 'lxml'
@@ -75,10 +77,9 @@ def parse_dates(week):
     return start_date, end_date
 
 
-def static_sandwiches(output2, soup):
+def parse_static_sandwiches(soup):
     """
     Parse sandwiches from the menu.
-    :param output2: The root output folder for v2.
     :param soup: BeautifulSoup of the page with the data.
     """
     sandwiches = []
@@ -92,18 +93,14 @@ def static_sandwiches(output2, soup):
             "price_small": ""  # workaround
         })
 
-    output_file2 = os.path.join(output2, STATIC_SANDWICHES)
-    write_json_to_file(sandwiches, output_file2)
+    return sandwiches
 
 
-def weekly_sandwiches(output, soup):
+def parse_weekly_sandwiches(soup):
     """
-    Parse the weekly sandwiches.
-
+    Parse the weekly sandwiches. The dates are kept as on the website, since they depend on the current date.
     :param soup: BeautifulSoup of the page with the data.
-    :param output: The root output for the sandwiches.
     """
-
     sandwiches = []
 
     tables = soup.find_all('table', limit=2)
@@ -111,15 +108,78 @@ def weekly_sandwiches(output, soup):
     if len(tables) >= 2:
         for row in soup.find_all('table', limit=2)[1].find_all("tr", class_=lambda x: x != 'tabelheader'):
             columns = row.find_all("td")
-            start, end = parse_dates(columns[0].text)
             sandwiches.append({
-                'start': start,
-                'end': end,
+                'dates': columns[0].text,
                 'name': columns[1].text.strip(),
                 'ingredients': parse_ingredients(columns[2].text),
                 'vegan': 'x' in columns[3].text
             })
 
+    return sandwiches
+
+
+def parse_salad_bowls(soup):
+    """
+    Get the salad bowls.
+    :param soup: BeautifulSoup of the page with the data.
+    """
+    bowls = []
+
+    tables = soup.find_all('table', limit=3)
+
+    if len(tables) >= 3:
+        for row in soup.find_all('table', limit=3)[2].find_all("tr", class_=lambda x: x != 'tabelheader'):
+            columns = row.find_all("td")
+            bowls.append({
+                'name': columns[0].text.strip(),
+                'description': columns[1].text.strip(),
+                'price': parse_money(columns[2].string) if columns[2].string else ""
+            })
+
+    return bowls
+
+
+def parse_sandwich_page(html):
+    """Parse everything on the sandwich page."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, HTML_PARSER)
+    return {
+        'static': parse_static_sandwiches(soup),
+        'weekly': parse_weekly_sandwiches(soup),
+        'salads': parse_salad_bowls(soup)
+    }
+
+
+def static_sandwiches(output2, sandwiches):
+    """
+    Write the sandwiches from the menu.
+    :param output2: The root output folder for v2.
+    :param sandwiches: The parsed sandwiches.
+    """
+    output_file2 = os.path.join(output2, STATIC_SANDWICHES)
+    write_json_to_file(sandwiches, output_file2)
+
+
+def weekly_sandwiches(output, parsed):
+    """
+    Write the weekly sandwiches.
+
+    :param output: The root output for the sandwiches.
+    :param parsed: The parsed weekly sandwiches.
+    """
+
+    sandwiches = []
+    for sandwich in parsed:
+        start, end = parse_dates(sandwich['dates'])
+        sandwiches.append({
+            'start': start,
+            'end': end,
+            'name': sandwich['name'],
+            'ingredients': sandwich['ingredients'],
+            'vegan': sandwich['vegan']
+        })
+
     today = datetime.date.today()
     # Write upcoming sandwiches to overview
     upcoming = [sandwich.copy() for sandwich in sandwiches if sandwich['end'] >= today]
@@ -158,25 +218,12 @@ def weekly_sandwiches(output, soup):
         write_json_to_file(existing, output_file)
 
 
-def salad_bowls(output, soup):
+def salad_bowls(output, bowls):
     """
-    Get the salad bowls.
+    Write the salad bowls.
     :param output: The root output folder for v2.
-    :param soup: BeautifulSoup of the page with the data.
+    :param bowls: The parsed salad bowls.
     """
-    bowls = []
-
-    tables = soup.find_all('table', limit=3)
-
-    if len(tables) >= 3:
-        for row in soup.find_all('table', limit=3)[2].find_all("tr", class_=lambda x: x != 'tabelheader'):
-            columns = row.find_all("td")
-            bowls.append({
-                'name': columns[0].text.strip(),
-                'description': columns[1].text.strip(),
-                'price': parse_money(columns[2].string) if columns[2].string else ""
-            })
-
     output_file = os.path.join(output, SALADS)
     write_json_to_file(bowls, output_file)
 
@@ -187,21 +234,30 @@ def all_sandwiches(output2):
     :param output2: The root output folder for v2.
     """
 
-    r = requests.get(SANDWICHES_URL)
-    soup = BeautifulSoup(r.text, HTML_PARSER)
+    r = retry_session.get(SANDWICHES_URL)
+    with metrics.timer('parse'):
+        # The result also depends on the code of parse_money.
+        parts = [r.text, sys.modules[parse_money.__module__]]
+        parsed = memo.memoized("sandwiches", parts, lambda: parse_sandwich_page(r.text))
+    metrics.count('sandwiches', sum(len(items) for items in parsed.values()))
 
-    static_sandwiches(output2, soup)
-    weekly_sandwiches(output2, soup)
-    salad_bowls(output2, soup)
+    static_sandwiches(output2, parsed['static'])
+    weekly_sandwiches(output2, parsed['weekly'])
+    salad_bowls(output2, parsed['salads'])
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run sandwich scraper')
     parser.add_argument('output2',
                         help='Path of the folder v2 in which the output must be written. Will be created if needed.')
+    backoff.add_arguments(parser)
     args = parser.parse_args()
+    backoff.use_arguments(args)
 
     output_path2 = os.path.abspath(args.output2)
     os.makedirs(output_path2, exist_ok=True)
 
-    all_sandwiches(output_path2)
+    with metrics.Run('sandwiches'):
+        all_sandwiches(output_path2)
+    print(memo.summary())
+    print(write_summary())
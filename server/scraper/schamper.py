@@ -6,17 +6,19 @@ Run the Schamper scraper.
 import argparse
 import locale
 import os
+import re
 import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-import htmlmin
-import lxml.html
-from bs4 import BeautifulSoup, CData, Tag
-from requests import RequestException
+from urllib.parse import urljoin
 
+import backoff
+import memo
+import metrics
 from backoff import retry_session
-from util import write_json_to_file
+from util import write_bytes_to_file, write_json_to_file, write_summary
 
 BASE_URL = 'https://www.schamper.ugent.be'
 RSS_URL = BASE_URL + '/rss'
@@ -24,6 +26,10 @@ RSS_URL = BASE_URL + '/rss'
 XML_PARSER = 'lxml-xml'
 HTML_PARSER = 'lxml'
 
+# Links in CSS, as the prefix, the link and the suffix.
+CSS_URL = re.compile(r"""(url\(\s*["']?)([^"')]*)(["']?\s*\))""", re.IGNORECASE)
+CSS_IMPORT = re.compile(r"""(@import\s+["'])([^"']*)(["'])""", re.IGNORECASE)
+
 # Hard-coded colours from the website
 CATEGORY_COLORS = defaultdict(lambda: '#010101', {
     'Satire': '#F9B126',
@@ -35,40 +41,82 @@ CATEGORY_COLORS = defaultdict(lambda: '#010101', {
 
 
 def read_xml_from_url(url):
+    from bs4 import BeautifulSoup
+
     response = retry_session.get(url)
-    return BeautifulSoup(response.text, XML_PARSER)
+    with metrics.timer('parse'):
+        return BeautifulSoup(response.text, XML_PARSER)
 
 
-def read_html_from_string(string):
-    """Parse a string as HTML"""
-    soup = BeautifulSoup(string, HTML_PARSER)
-    prettified = soup.prettify()
-    absolutified = lxml.html.make_links_absolute(prettified, base_url=BASE_URL)
-    return BeautifulSoup(absolutified, HTML_PARSER)
+class Article:
+    """
+    The content of an article in the feed. The HTML is parsed once; the description, the JSON objects and the Android
+    JSON objects are all extracted from the same tree.
+    """
 
+    def __init__(self, html):
+        from bs4 import BeautifulSoup
 
-def write_xml_to_file(doc, path):
-    with open(path, mode='w', encoding="utf-8") as f:
-        f.write(str(doc))
+        self.tree = BeautifulSoup(html, HTML_PARSER)
+        make_links_absolute(self.tree, BASE_URL)
+
+    def first_image(self):
+        """The source of the first image in the article, or None if there are no images."""
+        image = self.tree.find('img')
+        return image.get('src') if image is not None else None
+
+    def body(self):
+        """
+        The content of the body as minified HTML. The content is serialized as it is in the feed, without the
+        whitespace that prettify would add around the tags.
+        """
+        import htmlmin
+
+        encoded = self.tree.find('body').decode_contents(formatter='html')
+        return htmlmin.minify(encoded, remove_optional_attribute_quotes=False)
+
+
+def make_links_absolute(tree, base_url):
+    """
+    Make all links in a parsed document absolute, like lxml.html.make_links_absolute does for a string: the values of
+    the link attributes, and the urls in the CSS of style attributes and style elements.
+    """
+    from lxml.html.defs import link_attrs
+
+    for tag in tree.find_all(True):
+        for attribute in link_attrs.intersection(tag.attrs):
+            value = tag[attribute]
+            # Some attributes (e.g. archive) have multiple values, separated by whitespace.
+            if isinstance(value, list):
+                tag[attribute] = [urljoin(base_url, link) for link in value]
+            else:
+                tag[attribute] = urljoin(base_url, value.strip())
+        if 'style' in tag.attrs:
+            tag['style'] = absolute_css_links(tag['style'], base_url)
+        if tag.name == 'style' and tag.string:
+            tag.string = absolute_css_links(tag.string, base_url)
 
 
-def convert_rss_to_json(rss_feed):
-    return list(map(rss_item_to_object, rss_feed('item')))
+def absolute_css_links(css, base_url):
+    """Make the urls of url(...) and @import in CSS absolute."""
 
+    def absolute(match):
+        link = match.group(2).strip()
+        return match.group(1) + urljoin(base_url, link) + match.group(3) if link else match.group(0)
 
-def rss_item_to_object(rss_item):
+    return CSS_IMPORT.sub(absolute, CSS_URL.sub(absolute, css))
+
+
+def write_xml_to_file(doc, path):
+    write_bytes_to_file(str(doc).encode('utf-8'), path)
+
+
+def rss_item_to_object(rss_item, article):
     def convert_date(date):
         # TODO: Maybe convert this to ISO time or something?
         locale.setlocale(locale.LC_TIME, "en_US.utf8")
         return datetime.strptime(date, "%a, %d %b %Y %H:%M:%S %z").isoformat()
 
-    def find_first_image_in_content(article_content):
-        soupified = BeautifulSoup(article_content, HTML_PARSER)
-        images = [x.get('src') for x in soupified.find_all('img')]
-        if len(images) > 0:
-            return images[0]
-        return None
-
     content = "".join(rss_item.description.contents)
     category = rss_item.find('category').text
     return {
@@ -78,20 +126,14 @@ def rss_item_to_object(rss_item):
         'pub_date': convert_date(rss_item.pubDate.text),
         'author': rss_item.creator.text,
         'category': category,
-        'image': find_first_image_in_content(content),
+        'image': article.first_image(),
         'category_color': CATEGORY_COLORS[category]
     }
 
 
-def parse_content_in_json(articles):
-    """Loop through articles and parse them"""
-    return list(map(parse_content_object_in_json, articles))
-
-
-def parse_content_object_in_json(json_content):
-    """Extract stuff from the actual article"""
-    # The parsed article content
-    text = BeautifulSoup(json_content['text'], 'lxml')
+def parse_content_object_in_json(json_content, article):
+    """Extract stuff from the actual article. This changes the article, so it must be used last."""
+    text = article.tree
 
     intro_node = text.select_one('div.field-name-field-inleiding p')
 
@@ -122,14 +164,18 @@ def parse_content_object_in_json(json_content):
         'intro': intro,
         'image': json_content['image'],
         'images': images,
-        'body': "".join(text.find('body').decode_contents(formatter='html')),
+        'body': article.body(),
         'category': json_content['category'],
         'category_color': json_content['category_color']
     }
 
 
 def transform_item_in_feed(item):
-    """Transform an <item>"""
+    """
+    Transform an <item>
+    :return: The parsed article, or None if the item was removed.
+    """
+    from bs4 import CData, Tag
 
     link = item.link.text
     print('Processing {}'.format(link))
@@ -147,7 +193,8 @@ def transform_item_in_feed(item):
         return
 
     # Parse the article content as HTML
-    article = read_html_from_string(item.description.contents[0])
+    parsed = Article(item.description.contents[0])
+    article = parsed.tree
 
     # The creator in the RSS is a username, so try first to parse from the HTML.
     html_authors = _parse_article_authors(article)
@@ -174,8 +221,60 @@ def transform_item_in_feed(item):
     if edition_node is not None:
         edition_node.decompose()
 
-    encoded = article.find('body').decode_contents(formatter='html')
-    item.description.contents = [CData(htmlmin.minify(encoded, remove_optional_attribute_quotes=False))]
+    item.description.string = CData(parsed.body())
+    return parsed
+
+
+def standalone_item(root, item):
+    """The XML of an <item> as a document of its own, in the root element of the feed for the namespaces."""
+    from xml.sax.saxutils import quoteattr
+
+    namespaces = ''.join(f' {name}={quoteattr(value)}'
+                         for name, value in root.attrs.items() if name.startswith('xmlns'))
+    return f'<{root.name}{namespaces}>{item}</{root.name}>'
+
+
+def transform_article(document):
+    """
+    Transform an <item> and convert it to JSON. This only depends on its argument, so it can run in another process.
+    :param document: The item, as returned by standalone_item.
+    :return: The changes to the item and the JSON objects, or None if the item must be removed.
+    """
+    from bs4 import BeautifulSoup
+
+    item = BeautifulSoup(document, XML_PARSER).find('item')
+    article = transform_item_in_feed(item)
+    if article is None:
+        return None
+    creator = item.creator.string if item.creator is not None else None
+    category_tag = item('category')[-1]
+    json_object = rss_item_to_object(item, article)
+    return {
+        'description': str(item.description.string),
+        'creator': str(creator) if creator is not None else None,
+        'category': str(category_tag.string) if category_tag.string is not None else None,
+        'domain': category_tag.get('domain'),
+        'json': json_object,
+        'android': parse_content_object_in_json(json_object, article),
+    }
+
+
+def apply_transformation(item, transformed):
+    """Change an <item> in the feed like transform_item_in_feed, using the result of transform_article."""
+    from bs4 import CData, Tag
+
+    if transformed is None:
+        item.decompose()
+        return
+    if transformed['creator'] is not None:
+        item.creator.string = transformed['creator']
+    category_tag = Tag(name='category')
+    if transformed['category'] is not None:
+        category_tag.string = transformed['category']
+    if transformed['domain'] is not None:
+        category_tag['domain'] = transformed['domain']
+    item.append(category_tag)
+    item.description.string = CData(transformed['description'])
 
 
 def _parse_article_authors(article):
@@ -197,38 +296,71 @@ def _parse_article_authors(article):
     return author_string
 
 
-def run(output):
+def transform_feed(rss_feed, workers=1):
+    """
+    Transform all items of the feed. The results are cached by the content of the item, so only new or edited articles
+    are parsed.
+    :param workers: The amount of processes that transform articles at the same time.
+    :return: The JSON and Android JSON objects of the remaining items, in the order of the feed.
+    """
+    items = rss_feed('item')
+    documents = [standalone_item(rss_feed.find(True), item) for item in items]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            transformed = memo.memoized_map("schamper", transform_article, documents, executor)
+    else:
+        transformed = memo.memoized_map("schamper", transform_article, documents)
+
+    processed = []
+    for item, result in zip(items, transformed):
+        apply_transformation(item, result)
+        if result is not None:
+            processed.append((result['json'], result['android']))
+    return processed
+
+
+def run(output, workers=1):
     """
     Run the scraper.
+    :param workers: The amount of processes that transform articles at the same time.
     """
     output_path = os.path.abspath(output)  # Like realpath
     os.makedirs(output_path, exist_ok=True)  # Like mkdir -p
 
     rss_feed = read_xml_from_url(RSS_URL)
 
-    for item in rss_feed('item'):
-        transform_item_in_feed(item)
+    with metrics.timer('parse'):
+        processed = transform_feed(rss_feed, workers)
+    metrics.count('articles', len(processed))
 
     xml_output = os.path.join(output_path, 'daily.xml')
     json_output = os.path.join(output_path, 'daily.json')
     json_android_output = os.path.join(output_path, 'daily_android.json')
 
     write_xml_to_file(rss_feed, xml_output)
-    articles = convert_rss_to_json(rss_feed)
-    write_json_to_file(articles, json_output)
-    android_articles = parse_content_in_json(articles)
-    write_json_to_file(android_articles, json_android_output)
+    write_json_to_file([json_object for json_object, _ in processed], json_output)
+    write_json_to_file([android_object for _, android_object in processed], json_android_output)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run Schamper scraper')
     parser.add_argument('output',
                         help='Path of the folder in which the output must be written. Will be created if needed.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Amount of processes that transform articles at the same time (default 1).')
+    backoff.add_arguments(parser)
     args = parser.parse_args()
+    backoff.use_arguments(args)
+
+    from requests import RequestException
 
     try:
-        run(args.output)
+        with metrics.Run('schamper'):
+            run(args.output, args.workers)
     except RequestException as error:
         print("Failed to run Schamper scraper", file=sys.stderr)
         print(error, file=sys.stderr)
         sys.exit(1)
+
+    print(memo.summary())
+    print(write_summary())
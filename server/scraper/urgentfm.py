@@ -3,24 +3,37 @@
 Run the Urgent.fm scraper.
 """
 
+import json
 import os
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
-from requests import RequestException
 
+import backoff
+import metrics
 from backoff import retry_session
-from util import write_json_to_file
+from util import cache_path, write_json_to_file, write_summary
 
 URL = 'http://urgent.fm/'
 LIVE_URL = 'http://urgent.fm/listen_live.config'
 
+# The status is valid until the next run.
+VALIDITY = timedelta(hours=1)
+# The image and description of the programmes are kept this long.
+PROGRAMME_TTL = timedelta(days=1)
+# A programme without information is tried again after this time, as the information may be added or fail to parse.
+FAILED_PROGRAMME_TTL = timedelta(minutes=30)
+PROGRAMME_CACHE = cache_path('urgentfm', 'programmes.json')
+
 
 def get_programme():
+    from bs4 import BeautifulSoup
+
     response = retry_session.get(URL)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    link = soup.select('#header-text > a')[-1]
+    with metrics.timer('parse'):
+        soup = BeautifulSoup(response.text, 'html.parser')
+        link = soup.select('#header-text > a')[-1]
     programme_name = link.text
     programme_link = link['href']
     return programme_name, programme_link
@@ -35,14 +48,56 @@ def get_stream_link():
 
 
 def get_programme_description(link):
+    from bs4 import BeautifulSoup
+
     response = retry_session.get(URL + link)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    content = soup.select('.content')[0]
-    img = content.select('.field-name-field-radioprograms-image img')[0]['src']
-    text = content.select('.field-type-text-with-summary')[0].text
+    with metrics.timer('parse'):
+        soup = BeautifulSoup(response.text, 'html.parser')
+        content = soup.select('.content')[0]
+        img = content.select('.field-name-field-radioprograms-image img')[0]['src']
+        text = content.select('.field-type-text-with-summary')[0].text
     return img, text
 
 
+def load_programme_cache(now):
+    """The cached programme details that have not expired yet, by link."""
+    try:
+        with open(PROGRAMME_CACHE, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {link: details for link, details in cached.items() if datetime.fromisoformat(details['expires']) > now}
+
+
+def save_programme_cache(cached):
+    os.makedirs(os.path.dirname(PROGRAMME_CACHE), exist_ok=True)
+    temporary = f"{PROGRAMME_CACHE}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(cached, f)
+    os.replace(temporary, PROGRAMME_CACHE)
+
+
+def get_cached_programme_description(link, now):
+    """
+    Get the image and description of a programme, from the cache if they were fetched less than PROGRAMME_TTL ago, or
+    less than FAILED_PROGRAMME_TTL ago if there was no information.
+    :return: The image and the description.
+    """
+    cached = load_programme_cache(now)
+    if link not in cached:
+        ttl = PROGRAMME_TTL
+        try:
+            image, description = get_programme_description(link)
+        except IndexError:
+            # This means there is probably no information.
+            image, description = None, None
+            ttl = FAILED_PROGRAMME_TTL
+        cached[link] = {'image': image, 'description': description, 'expires': (now + ttl).isoformat()}
+        save_programme_cache(cached)
+    details = cached[link]
+    return details['image'], details['description']
+
+
 def run(output):
     """
     Run the scraper.
@@ -52,13 +107,14 @@ def run(output):
     os.makedirs(output_path, exist_ok=True)  # Like mkdir -p
     output_file = os.path.join(output_path, 'status.json')  # Output file
 
-    stream_link = get_stream_link()
-    programme, programme_link = get_programme()
-    try:
-        programme_image, programme_description = get_programme_description(programme_link)
-    except IndexError:
-        # This means there is probably no information.
-        programme_image, programme_description = None, None
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        stream_job = executor.submit(get_stream_link)
+        programme_job = executor.submit(get_programme)
+        stream_link = stream_job.result()
+        programme, programme_link = programme_job.result()
+
+    now = datetime.now()
+    programme_image, programme_description = get_cached_programme_description(programme_link, now)
 
     result = {
         'url': stream_link,
@@ -68,20 +124,29 @@ def run(output):
             'image': programme_image,
             'description': programme_description
         },
-        'validUntil': (datetime.now() + timedelta(hours=1)).isoformat()
+        # Stop using the status when it would be refreshed, or sooner if the details of the programme expire.
+        'validUntil': (now + VALIDITY).isoformat()
     }
     write_json_to_file(result, output_file)
+    metrics.count('programmes')
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run Urgent.fm scraper')
     parser.add_argument('output',
                         help='Path of the folder in which the output must be written. Will be created if needed.')
+    backoff.add_arguments(parser)
     args = parser.parse_args()
+    backoff.use_arguments(args)
+
+    from requests import RequestException
 
     try:
-        run(args.output)
+        with metrics.Run('urgentfm'):
+            run(args.output)
     except RequestException as error:
         print("Failed to run Urgent.fm scraper", file=sys.stderr)
         print(error, file=sys.stderr)
         sys.exit(1)
+
+    print(write_summary())
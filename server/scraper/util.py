@@ -1,7 +1,25 @@
+import collections
+import contextlib
 import os
 import re
 import sys
 import json
+import tempfile
+import threading
+
+# Root folder for data kept between runs that can be thrown away at any time.
+CACHE_ROOT = os.environ.get('HYDRA_CACHE_DIR') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'hydra')
+
+# Amount of output files that were written, and that were skipped since they did not change.
+write_stats = collections.Counter()
+_write_stats_lock = threading.Lock()
+
+# If set, every written file is also appended to this file, so only those files have to be published.
+# See resto.sh.
+CHANGE_MANIFEST = os.environ.get('HYDRA_CHANGE_MANIFEST')
+# The manifests of the files written in a folder, by folder. See record_changes.
+_folder_manifests = {}
 
 
 def parse_money(moneystring):
@@ -14,14 +32,92 @@ def stderr_print(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
-def write_json_to_file(obj, path):
+def cache_path(*parts):
+    """Get a path in the cache folder."""
+    return os.path.join(CACHE_ROOT, *parts)
+
+
+def write_bytes_to_file(data, path):
     """
-    Write an object to JSON at the specified path.
+    Write bytes to the specified path, unless the file already has exactly this content. Otherwise, the file is
+    replaced atomically, so readers never see a partially written file.
+    :return: True if the file was written.
     """
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, mode='rb') as f:
+                if f.read() == data:
+                    with _write_stats_lock:
+                        write_stats['skipped'] += 1
+                    return False
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = 0o644
+
     directory = os.path.dirname(path)
     os.makedirs(directory, exist_ok=True)
-    with open(path, mode='w') as f:
-        json.dump(obj, f, sort_keys=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode='wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temporary, mode)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+    _record_change(path)
+    return True
+
+
+def _record_change(path):
+    with _write_stats_lock:
+        write_stats['written'] += 1
+    add_to_manifest(path)
+
+
+def add_to_manifest(path):
+    """Append a changed path to CHANGE_MANIFEST and to the manifest of every folder it is in."""
+    path = os.path.abspath(path)
+    with _write_stats_lock:
+        manifests = {manifest for folder, manifest in _folder_manifests.items() if path.startswith(folder)}
+        if CHANGE_MANIFEST:
+            manifests.add(CHANGE_MANIFEST)
+        for manifest in manifests:
+            with open(manifest, mode='a') as f:
+                f.write(path + '\n')
+
+
+@contextlib.contextmanager
+def record_changes(folder, manifest):
+    """
+    Append the files written in a folder to a manifest while the block runs, also by other threads. Unlike with
+    CHANGE_MANIFEST, files that are written elsewhere at the same time, e.g. by other jobs of the daemon, are not added.
+    """
+    folder = os.path.join(os.path.abspath(folder), '')
+    with _write_stats_lock:
+        _folder_manifests[folder] = manifest
+    try:
+        yield
+    finally:
+        with _write_stats_lock:
+            _folder_manifests.pop(folder, None)
+
+
+def write_json_to_file(obj, path, sort_keys=True):
+    """
+    Write an object to JSON at the specified path. The file is only touched if the content changed.
+    :return: True if the file was written.
+    """
+    return write_bytes_to_file(json.dumps(obj, sort_keys=sort_keys).encode('utf-8'), path)
+
+
+def write_summary():
+    """Human readable overview of the written files."""
+    with _write_stats_lock:
+        return f"Output files: {write_stats['written']} written, {write_stats['skipped']} unchanged"
 
 
 def split_price(meal):